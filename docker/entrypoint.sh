@@ -0,0 +1,32 @@
+#!/bin/bash
+# コンテナ内のコマンドをホストの利用者 (TARGET_UID, TARGET_GID) の権限で実行する．
+# /workspaces や /lpp/data に書き込んだファイルは初めから利用者のものになる．
+#
+# rootless Docker などでコンテナの root がホストの利用者に対応している場合は，
+# root のまま実行する (権限を落とすと別の利用者のファイルになるため)．
+set -e
+
+if [ "$(id -u)" != 0 ] || [ -z "$TARGET_UID" ] || [ "$TARGET_UID" = 0 ]; then
+    exec "$@"
+fi
+
+# uid_map の1行目は「コンテナ内の UID，ホストの UID，個数」
+read -r _ host_uid _ </proc/self/uid_map
+if [ "$host_uid" = "$TARGET_UID" ]; then
+    exec "$@"
+fi
+
+TARGET_GID="${TARGET_GID:-$TARGET_UID}"
+if ! getent group "$TARGET_GID" >/dev/null; then
+    groupadd --gid "$TARGET_GID" lpp
+fi
+if ! getent passwd "$TARGET_UID" >/dev/null; then
+    # ホームディレクトリには /etc/skel の bashrc などが置かれる
+    useradd --uid "$TARGET_UID" --gid "$TARGET_GID" --create-home \
+        --shell /bin/bash lpp
+fi
+
+HOME="$(getent passwd "$TARGET_UID" | cut -d: -f6)"
+USER="$(getent passwd "$TARGET_UID" | cut -d: -f1)"
+export HOME USER
+exec setpriv --reuid="$TARGET_UID" --regid="$TARGET_GID" --init-groups -- "$@"
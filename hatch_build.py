@@ -0,0 +1,37 @@
+# Build hook: generate lpp_collector/testcases/manifest.json into the wheel
+
+import importlib.util
+import os
+import shutil
+import tempfile
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+
+
+class ManifestBuildHook(BuildHookInterface):
+    PLUGIN_NAME = "custom"
+
+    def initialize(self, version, build_data):
+        # editable install ではソースツリーを直接参照するため，実行時に走査させる
+        if self.target_name != "wheel" or version == "editable":
+            return
+
+        # パッケージの依存関係はビルド環境に無いため，manifest.py だけを読み込む
+        spec = importlib.util.spec_from_file_location(
+            "lpp_manifest", os.path.join(self.root, "lpp_collector", "manifest.py")
+        )
+        manifest = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(manifest)
+
+        self.temp_dir = tempfile.mkdtemp(prefix="lpp-manifest-")
+        output = manifest.write_manifest(
+            os.path.join(self.root, "lpp_collector", "testcases"),
+            os.path.join(self.temp_dir, manifest.MANIFEST_FILE),
+        )
+        build_data["force_include"][output] = (
+            f"lpp_collector/testcases/{manifest.MANIFEST_FILE}"
+        )
+
+    def finalize(self, version, build_data, artifact_path):
+        if getattr(self, "temp_dir", None):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
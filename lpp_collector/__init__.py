@@ -1,35 +1,161 @@
-from _pytest.config import Config
-from _pytest.reports import TestReport
+import os
+from typing import TYPE_CHECKING, List, Optional
 
-from lpp_collector.config import TARGETPATH
+from lpp_collector.config import (
+    IS_DOCKER_ENV,
+    LPP_UPLOAD_MODE,
+    LPP_UPLOAD_QUEUE_DB,
+    LPP_UPLOAD_QUEUE_DIR,
+    TARGETPATH,
+)
 
-from .uploader import Uploader
-from .consent import LppDevice
+# lpptest --jobs ではコンパイルのテストを先に別の pytest で実行するため，その結果を
+# LPP_SAVE_REPORTS のファイルに保存し，LPP_LOAD_REPORTS で次の pytest に引き継いで一緒に送る
+SAVE_REPORTS_ENV = "LPP_SAVE_REPORTS"
+LOAD_REPORTS_ENV = "LPP_LOAD_REPORTS"
+
+if TYPE_CHECKING:  # pragma: no cover
+    from _pytest.config import Config
+    from _pytest.reports import TestReport
+
+    from .consent import LppDevice
+    from .uploader import Uploader
+
+
+def has_pending_uploads() -> bool:
+    """送信待ちのテスト結果があるか (以前の形式の .dat も含む)
+
+    pytest の起動の度に呼ばれるため，upload_queue (payload, sel_client) は読み込まず，
+    標準ライブラリの sqlite3 で読み取り専用で開く
+    """
+    try:
+        with os.scandir(LPP_UPLOAD_QUEUE_DIR) as entries:
+            if any(entry.name.endswith(".dat") for entry in entries):
+                return True
+    except FileNotFoundError:
+        pass
+    if not os.path.exists(LPP_UPLOAD_QUEUE_DB):
+        return False
+
+    import sqlite3
+    from pathlib import Path
+
+    uri = Path(os.path.abspath(LPP_UPLOAD_QUEUE_DB)).as_uri() + "?mode=ro"
+    try:
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            return conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
 
 
 class LppCollector:
-    def __init__(self, config: Config):
-        self.consent = LppDevice()
-        self.uploader = Uploader(device_id="test_device_id")
-        if self.consent.get_device() is not None:
-            self.uploader.device_id = self.consent.get_device()["device_id"]
+    # uploader (httpx, sel_client) と consent (whiptail) は読み込みに時間がかかるため，
+    # 実際に使うまで import しない (pytest は登録されたプラグインの属性を全て参照するため，
+    # property ではなくメソッドにしている)
+    def __init__(self, config: "Config"):
+        self.config = config
+        self.reports: List["TestReport"] = []
+        self._consent: Optional["LppDevice"] = None
+        self._uploader: Optional["Uploader"] = None
+        self.save_reports = os.environ.get(SAVE_REPORTS_ENV, "")
+        if os.environ.get(LOAD_REPORTS_ENV, ""):
+            self.reports += self.load_reports(os.environ[LOAD_REPORTS_ENV])
         # Start background retry of failed uploads
-        self.uploader.start_background_retry()
+        # (detached の場合は送信用のプロセスに任せる)
+        if (
+            not self.save_reports
+            and LPP_UPLOAD_MODE != "detached"
+            and has_pending_uploads()
+        ):
+            self.get_uploader().start_background_retry()
+
+    def load_reports(self, path: str) -> List["TestReport"]:
+        import json
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return [
+            self.config.hook.pytest_report_from_serializable(
+                config=self.config, data=entry
+            )
+            for entry in data
+        ]
+
+    def write_reports(self, path: str):
+        import json
+
+        data = [
+            self.config.hook.pytest_report_to_serializable(
+                config=self.config, report=report
+            )
+            for report in self.reports
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def get_consent(self) -> "LppDevice":
+        if self._consent is None:
+            from .consent import LppDevice
 
-    def pytest_runtest_logreport(self, report: TestReport):
+            self._consent = LppDevice()
+        return self._consent
+
+    def get_uploader(self) -> "Uploader":
+        if self._uploader is None:
+            from .uploader import Uploader
+
+            self._uploader = Uploader(device_id="test_device_id")
+            if self.get_consent().get_device() is not None:
+                self._uploader.device_id = self.get_consent().get_device()["device_id"]
+        return self._uploader
+
+    def pytest_runtest_logreport(self, report: "TestReport"):
         if report.when == "call":
-            self.uploader.add_test_result(report)
+            self.reports.append(report)
 
     def pytest_sessionfinish(self, session, exitstatus):
-        if self.consent.get_device() is None:
-            self.uploader.store(source_dir=TARGETPATH, test_type="")
+        # --collect-only ではテストを実行しないため，送信するものがない
+        if session.config.option.collectonly:
+            return
+
+        if self.save_reports:
+            # 送信は結果を引き継いだ pytest で行う
+            self.write_reports(self.save_reports)
+            return
+
+        uploader = self.get_uploader()
+        consent = self.get_consent()
+        for report in self.reports:
+            uploader.add_test_result(report)
+
+        if consent.get_device() is None:
+            uploader.store(source_dir=TARGETPATH, test_type="")
             return
 
         test_type = "a"
 
-        self.uploader.device_id = self.consent.get_device()["device_id"]
-        self.uploader.upload(source_dir=TARGETPATH, test_dir=".", test_type=test_type)
+        if LPP_UPLOAD_MODE == "detached":
+            # 保存だけして終了し，送信は切り離したプロセスで行う
+            # (Docker の場合はコンテナが終了すると止まるため，ホスト側の lpptest が起動する)
+            uploader.store(source_dir=TARGETPATH, test_type=test_type)
+            if not IS_DOCKER_ENV:
+                from .agent import spawn
+
+                spawn()
+            return
+
+        uploader.device_id = consent.get_device()["device_id"]
+        uploader.upload(source_dir=TARGETPATH, test_dir=".", test_type=test_type)
 
 
-def pytest_configure(config: Config):  # pragma: no cover
+def pytest_configure(config: "Config"):  # pragma: no cover
+    # pytest-xdist のワーカーの結果はコントローラ側に集約されるため，ワーカーでは収集しない
+    if hasattr(config, "workerinput"):
+        return
     config.pluginmanager.register(LppCollector(config))
@@ -0,0 +1,81 @@
+"""送信できなかったテスト結果を pytest とは別のプロセスで送る (LPP_UPLOAD_MODE=detached)
+
+pytest の終了時にはテスト結果をキューに保存するだけにし，このプロセスを切り離して起動する．
+同時に複数起動された場合はロックを取れたものから順にキューを送り，送るものが無くなるか
+サーバに接続できなくなったら終了する．
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from lpp_collector.config import LPP_DATA_DIR
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_FILE = os.path.join(LPP_DATA_DIR, "upload_agent.lock")
+LOG_FILE = os.path.join(LPP_DATA_DIR, "upload_agent.log")
+# ログがこの大きさを超えたら作り直す
+LOG_MAX_SIZE = 1024 * 1024
+
+
+def spawn(module: str = "lpp_collector.agent", log_file: str = LOG_FILE, *args: str):
+    """module を実行するプロセスを切り離して起動する (終了は待たない)"""
+    os.makedirs(LPP_DATA_DIR, exist_ok=True)
+    try:
+        log_mode = "ab" if os.path.getsize(log_file) < LOG_MAX_SIZE else "wb"
+    except OSError:
+        log_mode = "ab"
+    with open(log_file, log_mode) as log:
+        subprocess.Popen(
+            [sys.executable, "-m", module, *args],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            close_fds=True,
+        )
+
+
+def drain(device_id: str):
+    from lpp_collector.flush import flush_queue
+    from lpp_collector.upload_queue import UploadQueue
+
+    queue = UploadQueue()
+    # 送っている間に他の pytest が保存したものも送る
+    while True:
+        queue.import_legacy()
+        if len(queue.ids(time.time())) == 0:
+            break
+        if not asyncio.run(flush_queue(queue, device_id, threading.Event())):
+            print(f"{time.ctime()}: server unreachable, retrying later", flush=True)
+            return
+    queue.compact()
+
+
+def main():
+    from lpp_collector.consent import LppDevice
+
+    os.makedirs(LPP_DATA_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as lock:
+        # 他のプロセスが送っている場合は，終わるのを待ってから残りを送る
+        # (諦めて終了すると，先のプロセスが確認した後に保存されたものが残るため)
+        # (ロックできない Windows でも，キューの貸し出しで同じものを重複して送ることはない)
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        device = LppDevice().get_device()
+        if device is None:
+            # 研究に同意していない場合は送らない
+            return
+        drain(device["device_id"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# Batch grading: run one testsuite over many submission directories
+
+import argparse
+import csv
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List
+
+from lpp_collector.config import IS_DOCKER_ENV, LPP_DATA_DIR, TEST_BASE_DIR
+from .docker import run_test_container, update
+from .manifest import list_testsuites
+
+
+def list_submissions(submissions_dir: str) -> List[Path]:
+    return sorted(
+        entry
+        for entry in Path(submissions_dir).iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    )
+
+
+def prepare_slots(work_dir: str, jobs: int) -> "queue.Queue[Path]":
+    # mpplc の出力 (.csl) は入力ファイルと同じディレクトリ (テストケースのディレクトリ) に書き込まれるため，
+    # 同時に実行する提出物毎にテストケースの複製を用意する
+    slots: "queue.Queue[Path]" = queue.Queue()
+    for i in range(jobs):
+        slot_dir = Path(work_dir) / f"slot{i}"
+        shutil.copytree(
+            TEST_BASE_DIR,
+            slot_dir,
+            ignore=shutil.ignore_patterns("__pycache__", "casl2", "*.csl"),
+        )
+        slots.put(slot_dir)
+    return slots
+
+
+def grade_submission(
+    submission: Path, testsuite: str, slots: "queue.Queue[Path]", pytest_args: List[str]
+) -> Dict[str, Any]:
+    slot_dir = slots.get()
+    try:
+        report_file = slot_dir / "report.json"
+        if report_file.exists():
+            report_file.unlink()
+
+        testcase_paths = [
+            str(slot_dir / testsuite / testcase)
+            for testcase in list_testsuites(str(slot_dir))[testsuite]
+        ]
+
+        env = dict(os.environ)
+        env["LPP_TARGET_PATH"] = str(submission.absolute())
+        env["LPP_TEST_BASE_DIR"] = str(slot_dir)
+
+        started = time.time()
+        exitcode = subprocess.call(
+            [
+                sys.executable,
+                "-m",
+                "pytest",
+                # 採点結果は研究用サーバに送信しない
+                "-p",
+                "no:lpp_collector",
+                "-p",
+                "no:cacheprovider",
+                "-q",
+                "--json-report",
+                f"--json-report-file={report_file}",
+                *pytest_args,
+                *testcase_paths,
+            ],
+            cwd=slot_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        duration = time.time() - started
+
+        tests: List[Dict[str, str]] = []
+        summary: Dict[str, int] = {}
+        if report_file.exists():
+            with open(report_file, encoding="utf-8") as f:
+                report = json.load(f)
+            summary = {
+                key: value
+                for key, value in report.get("summary", {}).items()
+                if isinstance(value, int)
+            }
+            tests = [
+                {"nodeid": test["nodeid"], "outcome": test["outcome"]}
+                for test in report.get("tests", [])
+            ]
+
+        return {
+            "submission": submission.name,
+            "exitcode": exitcode,
+            "duration": round(duration, 3),
+            "summary": summary,
+            "tests": tests,
+        }
+    finally:
+        slots.put(slot_dir)
+
+
+def write_results(results: List[Dict[str, Any]], output: str):
+    with open(f"{output}.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    nodeids: List[str] = []
+    for result in results:
+        for test in result["tests"]:
+            if test["nodeid"] not in nodeids:
+                nodeids.append(test["nodeid"])
+
+    summary_keys = ["passed", "failed", "error", "skipped", "total"]
+    with open(f"{output}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["submission", "exitcode", "duration", *summary_keys, *nodeids])
+        for result in results:
+            outcomes = {test["nodeid"]: test["outcome"] for test in result["tests"]}
+            writer.writerow(
+                [
+                    result["submission"],
+                    result["exitcode"],
+                    result["duration"],
+                    *[result["summary"].get(key, 0) for key in summary_keys],
+                    *[outcomes.get(nodeid, "") for nodeid in nodeids],
+                ]
+            )
+
+
+def run_batch(args):
+    if args.testsuite not in list_testsuites():
+        print(f"Testsuite {args.testsuite} not found")
+        return
+
+    submissions = list_submissions(args.submissions)
+    if len(submissions) == 0:
+        print(f"No submissions found in {args.submissions}")
+        return
+
+    jobs = max(1, min(args.jobs, len(submissions)))
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory(prefix="lppbatch-") as work_dir:
+        slots = prepare_slots(work_dir, jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    grade_submission,
+                    submission,
+                    args.testsuite,
+                    slots,
+                    args.pytest_args,
+                )
+                for submission in submissions
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                results.append(result)
+                print(
+                    f"[{done}/{len(submissions)}] {result['submission']}: "
+                    f"{result['summary'].get('passed', 0)}/{result['summary'].get('total', 0)} passed"
+                )
+
+    results.sort(key=lambda result: result["submission"])
+    write_results(results, args.output)
+    print(f"Results written to {args.output}.json and {args.output}.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a testsuite against every submission in a directory"
+    )
+    parser.add_argument(
+        "submissions",
+        help="Directory containing one subdirectory per submission (relative to the current directory)",
+    )
+    parser.add_argument("testsuite", help="Specify testsuite")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of submissions graded at the same time",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="lpp_results",
+        help="Output file prefix for the JSON/CSV result table",
+    )
+    # 未知の引数はそのまま pytest に渡す
+    args, pytest_args = parser.parse_known_args()
+    args.pytest_args = pytest_args
+
+    if not os.path.exists(LPP_DATA_DIR):
+        os.mkdir(LPP_DATA_DIR)
+
+    if IS_DOCKER_ENV:
+        run_batch(args)
+    else:
+        update()
+        run_test_container(["lppbatch", *sys.argv[1:]])
@@ -0,0 +1,126 @@
+"""研究用サーバへの接続のサーキットブレーカ
+
+接続できない状態 (タイムアウト，接続の拒否など) が LPP_BREAKER_THRESHOLD 回続いたら，
+LPP_BREAKER_COOLDOWN 秒の間は接続を試みずに諦める．その後は TCP の接続だけを試し，
+接続できれば再び送信する．接続できなければ待つ時間を倍にする (最大 BREAKER_MAX_COOLDOWN 秒)．
+状態はデータディレクトリに保存し，pytest の実行をまたいで引き継ぐ．
+
+HTTP のエラー (4xx, 5xx) はサーバに接続できているため，失敗として数えない．
+"""
+
+import json
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+from urllib.parse import urlsplit
+
+import httpx
+
+from lpp_collector.config import (
+    LPP_BASE_URL,
+    LPP_BREAKER_COOLDOWN,
+    LPP_BREAKER_FILE,
+    LPP_BREAKER_THRESHOLD,
+)
+
+BREAKER_MAX_COOLDOWN = 60 * 60
+# 再開する前に TCP の接続を試す際のタイムアウト (秒)
+PROBE_TIMEOUT = 1.0
+
+
+class CircuitOpen(Exception):
+    """サーバに接続できない状態が続いているため，接続を試みなかった"""
+
+
+class CircuitBreaker:
+    def __init__(self, base_url: str = LPP_BASE_URL, path: str = LPP_BREAKER_FILE):
+        self.base_url = base_url
+        self.path = path
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get("base_url") != self.base_url:
+            state = {"base_url": self.base_url}
+        state.setdefault("failures", 0)
+        state.setdefault("opened_at", None)
+        state.setdefault("cooldown", LPP_BREAKER_COOLDOWN)
+        return state
+
+    def save(self, state: Dict[str, Any]):
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".breaker-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def probe(self) -> bool:
+        """サーバの TCP のポートに接続できるか"""
+        url = urlsplit(self.base_url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        try:
+            with socket.create_connection((url.hostname, port), PROBE_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    def allow(self) -> bool:
+        """接続を試みてよいか"""
+        state = self.load()
+        if state["opened_at"] is None:
+            return True
+        if time.time() - state["opened_at"] < state["cooldown"]:
+            return False
+        if self.probe():
+            # 接続できたため，実際の送信の結果で閉じるか再び開くかを決める
+            return True
+        self.open(state, min(state["cooldown"] * 2, BREAKER_MAX_COOLDOWN))
+        return False
+
+    def open(self, state: Dict[str, Any], cooldown: float):
+        state["opened_at"] = time.time()
+        state["cooldown"] = cooldown
+        self.save(state)
+
+    def record_success(self):
+        state = self.load()
+        # 変化が無い場合は書き込まない
+        if state["failures"] == 0 and state["opened_at"] is None:
+            return
+        self.save({"base_url": self.base_url})
+
+    def record_failure(self):
+        state = self.load()
+        state["failures"] += 1
+        if state["opened_at"] is not None:
+            # 再開を試みて失敗した
+            self.open(state, min(state["cooldown"] * 2, BREAKER_MAX_COOLDOWN))
+        elif state["failures"] >= LPP_BREAKER_THRESHOLD:
+            self.open(state, LPP_BREAKER_COOLDOWN)
+        else:
+            self.save(state)
+
+    @contextmanager
+    def attempt(self, force: bool = False) -> Iterator[None]:
+        """with の中での接続の成否を記録する．開いている場合は CircuitOpen を送出する．
+
+        force=True の場合 (同意の登録など，利用者が明示的に行う操作) は開いていても接続を試みる．
+        """
+        if not force and not self.allow():
+            raise CircuitOpen(f"{self.base_url} is unreachable, skipped")
+        try:
+            yield
+        except httpx.TransportError:
+            self.record_failure()
+            raise
+        self.record_success()
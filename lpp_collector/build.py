@@ -0,0 +1,101 @@
+"""ソースコードのハッシュをキーにしたビルド結果のキャッシュ"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List
+
+from lpp_collector.config import (
+    LPP_BUILD_CACHE,
+    LPP_BUILD_CACHE_DIR,
+    LPP_BUILD_CACHE_ENTRIES,
+    TARGETPATH,
+)
+from lpp_collector.process import run_capture
+from lpp_collector.walk import find_source_files
+
+# ビルドに使われるツール (更新された場合はキャッシュを使わない)
+BUILD_TOOLS = ["make", "gcc", "cc"]
+
+
+def build_key(target: str, build_cmd: List[str], source_dir: str) -> str:
+    """ソースコード，ビルドコマンド，コンパイラからキャッシュのキーを求める"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([target, build_cmd]).encode("utf-8"))
+
+    for tool in BUILD_TOOLS:
+        tool_path = shutil.which(tool)
+        if tool_path is not None:
+            stat = os.stat(tool_path)
+            digest.update(f"{tool_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    # 送信しないファイル (.lppignore や大きすぎるもの) の変更もビルドに影響する
+    for source_file in find_source_files(source_dir, upload_filters=False):
+        digest.update(os.path.relpath(source_file, source_dir).encode("utf-8"))
+        digest.update(b"\0")
+        with open(source_file, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+
+    return digest.hexdigest()
+
+
+def run_build(build_cmd: List[str]):
+    # 資源の制限は学生のプログラムのためのもので，make や gcc には課さない
+    # (重いビルドが SIGXCPU で終了し，コンパイルの失敗として扱われないようにする)
+    return run_capture(build_cmd, memory_limit=0, cpu_limit=0)
+
+
+def store(cache_dir: Path, binary: Path, stdout: str, stderr: str):
+    os.makedirs(cache_dir.parent, exist_ok=True)
+    # 並列に採点している他のプロセスと衝突しないよう，一時ディレクトリに書いてから移動する
+    tmp_dir = Path(tempfile.mkdtemp(dir=cache_dir.parent, prefix=".tmp-"))
+    try:
+        shutil.copy2(binary, tmp_dir / binary.name)
+        with open(tmp_dir / "output.json", "w", encoding="utf-8") as f:
+            json.dump({"stdout": stdout, "stderr": stderr}, f)
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # 他のプロセスが同じキーで保存済み
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    prune(cache_dir.parent)
+
+
+def prune(cache_root: Path):
+    """古いものから削除し，エントリ数を LPP_BUILD_CACHE_ENTRIES 以下に保つ"""
+    entries = [
+        entry for entry in cache_root.iterdir() if not entry.name.startswith(".")
+    ]
+    if len(entries) <= LPP_BUILD_CACHE_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - LPP_BUILD_CACHE_ENTRIES]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def cached_build(target: str, build_cmd: List[str], source_dir: str = TARGETPATH):
+    """ビルドコマンドを実行し，[stdout, stderr] を返す．
+
+    同じソースコードのビルド結果がキャッシュにあれば，ビルドせずに実行ファイルを復元する．
+    """
+    binary = Path(source_dir) / target
+    if not LPP_BUILD_CACHE:
+        result = run_build(build_cmd)
+        return [result.stdout, result.stderr]
+
+    cache_dir = Path(LPP_BUILD_CACHE_DIR) / build_key(target, build_cmd, source_dir)
+    cached_binary = cache_dir / target
+    if cached_binary.exists():
+        shutil.copy2(cached_binary, binary)
+        # 最近使ったものを残すため，更新日時を記録する
+        os.utime(cache_dir)
+        with open(cache_dir / "output.json", encoding="utf-8") as f:
+            output = json.load(f)
+        return [output["stdout"], output["stderr"]]
+
+    result = run_build(build_cmd)
+    if result.returncode == 0 and binary.is_file():
+        store(cache_dir, binary, result.stdout, result.stderr)
+    return [result.stdout, result.stderr]
@@ -0,0 +1,115 @@
+"""出力ファイルと期待される出力の比較"""
+
+import hashlib
+from dataclasses import dataclass, field
+from itertools import zip_longest
+from typing import Iterator, List, Optional, TextIO
+
+# 差分として表示する不一致行の最大数
+COMPARE_MAX_REPORT = 10
+# 比較する最大行数 (これを超えた分は読まずに打ち切る)
+COMPARE_MAX_LINES = 100000
+# 1行あたりに読み込む最大文字数 (超えた部分は読み捨てる)
+COMPARE_MAX_LINE_LENGTH = 4096
+# 差分に表示する1行あたりの最大文字数
+COMPARE_MAX_DIFF_WIDTH = 200
+
+
+@dataclass
+class CompareResult:
+    """比較結果"""
+
+    mismatches: int = 0
+    mismatch_lines: List[int] = field(default_factory=list)
+    diff: List[str] = field(default_factory=list)
+    truncated: bool = False
+
+    @property
+    def matched(self) -> bool:
+        # 打ち切った場合は残りの行が一致するか分からないため，一致とはしない
+        return self.mismatches == 0 and not self.truncated
+
+    def message(self, title: str = "Line does not match.") -> str:
+        count = f"{self.mismatches}+" if self.truncated else str(self.mismatches)
+        lines = ", ".join(str(line) for line in self.mismatch_lines)
+        if self.mismatches > len(self.mismatch_lines):
+            lines += ", ..."
+        summary = f"{title} {count} line(s) differ: {lines}"
+        if self.truncated:
+            summary += " (too many lines, the rest was not compared)"
+        return "\n".join([summary, *self.diff])
+
+
+def read_lines(fp: TextIO, max_line_length: int) -> Iterator[str]:
+    """改行を除いた行を1行ずつ読み込む．長すぎる行は切り詰める．"""
+    while True:
+        line = fp.readline(max_line_length)
+        if not line:
+            return
+        if line.endswith("\n"):
+            yield line[:-1]
+            continue
+        if len(line) < max_line_length:
+            # 改行で終わらない最終行
+            yield line
+            continue
+        # 長すぎる行は残りを読み捨てる．ただし残りだけが異なる行を一致としないよう，
+        # 残りの長さとハッシュ値を行に付け加える
+        tail = hashlib.sha256()
+        tail_length = 0
+        rest = fp.readline(max_line_length)
+        while rest:
+            end = rest.endswith("\n")
+            if end:
+                rest = rest[:-1]
+            tail.update(rest.encode("utf-8"))
+            tail_length += len(rest)
+            if end:
+                break
+            rest = fp.readline(max_line_length)
+        if tail_length == 0:
+            yield line
+        else:
+            yield f"{line}...(+{tail_length} chars, sha256:{tail.hexdigest()[:16]})"
+
+
+def shorten(line: str, width: int = COMPARE_MAX_DIFF_WIDTH) -> str:
+    return line if len(line) <= width else line[:width] + "..."
+
+
+def compare_files(
+    out_file,
+    expect_file,
+    fillvalue: Optional[str] = "",
+    max_report: int = COMPARE_MAX_REPORT,
+    max_lines: int = COMPARE_MAX_LINES,
+    max_line_length: int = COMPARE_MAX_LINE_LENGTH,
+) -> CompareResult:
+    """2つのファイルを1行ずつ読みながら比較し，不一致の行を数える．
+
+    行数の異なる部分は fillvalue と比較する．max_lines 行を超えた場合は比較を打ち切る．
+    """
+    result = CompareResult()
+    with open(out_file, encoding="utf-8", errors="replace") as ofp, open(
+        expect_file, encoding="utf-8", errors="replace"
+    ) as efp:
+        pairs = zip_longest(
+            read_lines(ofp, max_line_length),
+            read_lines(efp, max_line_length),
+            fillvalue=fillvalue,
+        )
+        for lineno, (out_line, est_line) in enumerate(pairs, start=1):
+            if lineno > max_lines:
+                result.truncated = True
+                break
+            if out_line == est_line:
+                continue
+            result.mismatches += 1
+            if len(result.mismatch_lines) < max_report:
+                result.mismatch_lines.append(lineno)
+                result.diff.append(f"@@ -{lineno} +{lineno} @@")
+                if est_line is not None:
+                    result.diff.append(f"-{shorten(est_line)}")
+                if out_line is not None:
+                    result.diff.append(f"+{shorten(out_line)}")
+    return result
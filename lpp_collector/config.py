@@ -43,15 +43,49 @@ LPP_REVOKE_CONSENT_TEXT = """
 
 LPP_SOURCE_FILES = ["*.c", "*.h", "CMakelists.txt", "Makefile", "makefile"]
 
-TEST_BASE_DIR = os.path.join(os.path.dirname(lpp_collector.__file__), "testcases")
+TEST_BASE_DIR = (
+    os.environ["LPP_TEST_BASE_DIR"]
+    if "LPP_TEST_BASE_DIR" in os.environ
+    else os.path.join(os.path.dirname(lpp_collector.__file__), "testcases")
+)
+
+# 学生のプログラムを実行する際の制限 (0 の場合は制限しない)
+# stdout / stderr それぞれで保持する最大バイト数
+LPP_OUTPUT_LIMIT = (
+    int(os.environ["LPP_OUTPUT_LIMIT"])
+    if "LPP_OUTPUT_LIMIT" in os.environ
+    else 8 * 1024 * 1024
+)
+# アドレス空間の上限 (バイト)
+LPP_MEMORY_LIMIT = (
+    int(os.environ["LPP_MEMORY_LIMIT"])
+    if "LPP_MEMORY_LIMIT" in os.environ
+    else 1024 * 1024 * 1024
+)
+# CPU 時間の上限 (秒)
+LPP_CPU_LIMIT = (
+    int(os.environ["LPP_CPU_LIMIT"]) if "LPP_CPU_LIMIT" in os.environ else 10
+)
 
 # Docker environment
 IS_DOCKER_ENV = os.path.exists("/.dockerenv")
+# テストの実行に使うイメージ
 DOCKER_IMAGE = (
     os.environ["DOCKER_IMAGE"]
     if "DOCKER_IMAGE" in os.environ
-    else "ghcr.io/f0reacharr/lpp_test:latest"
+    else "ghcr.io/f0reacharr/lpp_test:runtime"
 )
+# lppdoxygen で使うイメージ (doxygen と LaTeX を含む．lppdoxygen の初回に pull する)
+DOCKER_DOCS_IMAGE = (
+    os.environ["DOCKER_DOCS_IMAGE"]
+    if "DOCKER_DOCS_IMAGE" in os.environ
+    else "ghcr.io/f0reacharr/lpp_test:docs"
+)
+
+# 起動済みのコンテナを使い回し，docker exec でテストを実行する
+LPP_CONTAINER_POOL = os.environ.get("LPP_CONTAINER_POOL", "") not in ("", "0")
+# 作業ディレクトリをバインドマウントせず，ソースコードだけをボリュームにコピーして lpptest を実行する
+LPP_SYNC_MODE = os.environ.get("LPP_SYNC_MODE", "") not in ("", "0")
 
 
 def derive_data_dir():
@@ -67,6 +101,102 @@ def derive_data_dir():
 LPP_DATA_DIR = derive_data_dir()
 
 LPP_UPDATE_MARKER = os.path.join(LPP_DATA_DIR, ".update_marker")
+LPP_DOCS_UPDATE_MARKER = os.path.join(LPP_DATA_DIR, ".update_marker_docs")
+
+# 送信できなかったテスト結果
+LPP_UPLOAD_QUEUE_DB = os.path.join(LPP_DATA_DIR, "upload_queue.sqlite3")
+# 送信できなかったテスト結果のソースコード (SHA-256 をファイル名にする)
+LPP_UPLOAD_QUEUE_BLOB_DIR = os.path.join(LPP_DATA_DIR, "upload_queue_blobs")
+# 以前の形式 (pickle) で保存されたテスト結果
+LPP_UPLOAD_QUEUE_DIR = os.path.join(LPP_DATA_DIR, "upload_queue")
+
+# テスト結果の送信方法
+# inline: pytest の終了時に送る
+# detached: pytest の終了時には保存だけして，切り離したプロセスで送る
+LPP_UPLOAD_MODE = (
+    os.environ["LPP_UPLOAD_MODE"] if "LPP_UPLOAD_MODE" in os.environ else "inline"
+)
+# 送信するソースコードの tar の圧縮形式 (tar / gzip / zstd)
+LPP_UPLOAD_FORMAT = (
+    os.environ["LPP_UPLOAD_FORMAT"] if "LPP_UPLOAD_FORMAT" in os.environ else "tar"
+)
+# サーバが持っていないファイルの内容だけを送る (LPP_UPLOAD_DEDUP=0 で無効)
+LPP_UPLOAD_DEDUP = os.environ.get("LPP_UPLOAD_DEDUP", "1") not in ("", "0")
+LPP_SNAPSHOT_INDEX = os.path.join(LPP_DATA_DIR, "snapshot_index.json")
+# 結果 (JSON) の最大バイト数．超える場合は失敗メッセージを切り詰める (0 の場合は制限しない)
+LPP_UPLOAD_BUDGET = (
+    int(os.environ["LPP_UPLOAD_BUDGET"])
+    if "LPP_UPLOAD_BUDGET" in os.environ
+    else 1024 * 1024
+)
+# アップロードのタイムアウト (秒)
+LPP_UPLOAD_TIMEOUT = (
+    float(os.environ["LPP_UPLOAD_TIMEOUT"]) if "LPP_UPLOAD_TIMEOUT" in os.environ else 3
+)
+# 送信できなかったテスト結果を再送する際の並列数と，1件あたりの再送回数
+LPP_UPLOAD_CONCURRENCY = (
+    int(os.environ["LPP_UPLOAD_CONCURRENCY"])
+    if "LPP_UPLOAD_CONCURRENCY" in os.environ
+    else 4
+)
+LPP_UPLOAD_RETRIES = (
+    int(os.environ["LPP_UPLOAD_RETRIES"]) if "LPP_UPLOAD_RETRIES" in os.environ else 3
+)
+# 送信できなかったテスト結果を1回のリクエストでまとめて送る件数 (1 の場合は1件ずつ送る)
+LPP_UPLOAD_BATCH = (
+    int(os.environ["LPP_UPLOAD_BATCH"]) if "LPP_UPLOAD_BATCH" in os.environ else 16
+)
+# サーバに接続できないことがこの回数続いたら，LPP_BREAKER_COOLDOWN 秒の間は接続を試みない
+LPP_BREAKER_THRESHOLD = (
+    int(os.environ["LPP_BREAKER_THRESHOLD"])
+    if "LPP_BREAKER_THRESHOLD" in os.environ
+    else 3
+)
+LPP_BREAKER_COOLDOWN = (
+    float(os.environ["LPP_BREAKER_COOLDOWN"])
+    if "LPP_BREAKER_COOLDOWN" in os.environ
+    else 300
+)
+LPP_BREAKER_FILE = os.path.join(LPP_DATA_DIR, "breaker.json")
+# 同意の登録と取り消しのタイムアウト (秒)
+LPP_CONSENT_TIMEOUT = (
+    float(os.environ["LPP_CONSENT_TIMEOUT"])
+    if "LPP_CONSENT_TIMEOUT" in os.environ
+    else 10
+)
+
+# ソースコードとして集めるファイルの最大サイズ (0 の場合は制限しない)
+LPP_SOURCE_MAX_SIZE = (
+    int(os.environ["LPP_SOURCE_MAX_SIZE"])
+    if "LPP_SOURCE_MAX_SIZE" in os.environ
+    else 1024 * 1024
+)
+# ソースコードを集める際にシンボリックリンクのディレクトリを辿る
+LPP_SOURCE_FOLLOW_SYMLINKS = os.environ.get("LPP_SOURCE_FOLLOW_SYMLINKS", "") not in (
+    "",
+    "0",
+)
+# ソースコードのディレクトリ毎の一覧 (更新日時が変わっていなければ読み直さない)
+LPP_SOURCE_WALK_CACHE = os.path.join(LPP_DATA_DIR, "source_walk.json")
+# LPP_SYNC_MODE でボリュームにコピーしたファイルの一覧 (ボリューム毎)
+LPP_SYNC_INDEX_DIR = os.path.join(LPP_DATA_DIR, "sync_index")
+
+# ビルド結果のキャッシュ (LPP_BUILD_CACHE=0 で無効)
+LPP_BUILD_CACHE = os.environ.get("LPP_BUILD_CACHE", "1") not in ("", "0")
+LPP_BUILD_CACHE_DIR = os.path.join(LPP_DATA_DIR, "build_cache")
+LPP_BUILD_CACHE_ENTRIES = (
+    int(os.environ["LPP_BUILD_CACHE_ENTRIES"])
+    if "LPP_BUILD_CACHE_ENTRIES" in os.environ
+    else 512
+)
+
+# --incremental で成功したテストケースを記録するディレクトリ
+LPP_RESULT_CACHE_DIR = os.path.join(LPP_DATA_DIR, "result_cache")
+LPP_RESULT_CACHE_ENTRIES = (
+    int(os.environ["LPP_RESULT_CACHE_ENTRIES"])
+    if "LPP_RESULT_CACHE_ENTRIES" in os.environ
+    else 100000
+)
 LPP_UPDATE_INTERVAL = 60 * 60 * 24  # 1 day
 
 
@@ -81,3 +211,37 @@ def derive_target_path():
 
 
 TARGETPATH = derive_target_path()
+
+
+# pytest-xdist で並列実行する場合のワーカー識別子 (例: gw0)
+LPP_WORKER_ID = os.environ.get("PYTEST_XDIST_WORKER", "")
+
+
+def derive_test_result_dir():
+    result_dir = os.path.join(TARGETPATH, "test_results")
+    if LPP_WORKER_ID:
+        # ワーカー毎に出力先を分け，同名ファイルの衝突を避ける
+        return os.path.join(result_dir, LPP_WORKER_ID)
+    return result_dir
+
+
+TEST_RESULT_DIR = derive_test_result_dir()
+
+
+def derive_scratch_dir():
+    if "LPP_SCRATCH_DIR" in os.environ:
+        return os.environ["LPP_SCRATCH_DIR"]
+
+    # run_test_container が tmpfs をマウントしている場合だけ使う
+    if IS_DOCKER_ENV and os.path.ismount("/lpp/scratch"):
+        return "/lpp/scratch"
+    else:
+        return ""
+
+
+# テストケースの途中の出力を置くディレクトリ (空の場合は TEST_RESULT_DIR に直接書き込む)
+LPP_SCRATCH_DIR = derive_scratch_dir()
+# TEST_RESULT_DIR に残す出力 (failed: 失敗したテストケースのみ / all: 全て)
+LPP_KEEP_ARTIFACTS = (
+    os.environ["LPP_KEEP_ARTIFACTS"] if "LPP_KEEP_ARTIFACTS" in os.environ else "failed"
+)
@@ -3,13 +3,14 @@
 import os
 import sys
 
-from lpp_collector.docker import fix_permission, run_test_container, update
+from lpp_collector.docker import run_test_container, update
 from .config import (
     IS_DOCKER_ENV,
     LPP_AFTER_CONSENT_TEXT,
     LPP_BASE_URL,
     LPP_DATA_DIR,
     LPP_CONSENT_TEXT,
+    LPP_CONSENT_TIMEOUT,
     LPP_REVOKE_CONSENT_TEXT,
 )
 from json import load, dump
@@ -18,7 +19,9 @@ try:
     from typing import TypedDict, Optional
 except ImportError:
     from typing_extensions import TypedDict, Optional
+from httpx import Timeout
 from whiptail import Whiptail
+from .breaker import CircuitBreaker
 from .sel_client import Client
 from .sel_client.api.default import (
     delete_api_device_device_id,
@@ -68,7 +71,9 @@ def show_consent():
     current_device = consent_info.get_device()
 
     whiptail = Whiptail(title="Consent Form for experiment")
-    client = Client(LPP_BASE_URL)
+    client = Client(LPP_BASE_URL, timeout=Timeout(LPP_CONSENT_TIMEOUT))
+    # 利用者が明示的に行う操作のため，接続できない状態が続いていても試す
+    breaker = CircuitBreaker()
 
     if current_device is not None:
         consent = whiptail.run(
@@ -88,10 +93,11 @@ def show_consent():
             return
 
         try:
-            response = delete_api_device_device_id.sync_detailed(
-                current_device["device_id"],
-                client=client,
-            )
+            with breaker.attempt(force=True):
+                response = delete_api_device_device_id.sync_detailed(
+                    current_device["device_id"],
+                    client=client,
+                )
             if response is None:
                 print("同意情報の取り消しに失敗しました")
                 return
@@ -119,9 +125,10 @@ def show_consent():
         return
 
     try:
-        response = post_api_device_device_id.sync_detailed(
-            client=client, device_id=current_device["device_id"]
-        )
+        with breaker.attempt(force=True):
+            response = post_api_device_device_id.sync_detailed(
+                client=client, device_id=current_device["device_id"]
+            )
         if response is None:
             print("同意情報の送信に失敗しました")
             return
@@ -140,7 +147,3 @@ def main():
     else:
         update()
         run_test_container(["lppconsent", *sys.argv[1:]])
-
-    if IS_DOCKER_ENV:
-        # Fix permissions
-        fix_permission()
@@ -1,51 +1,120 @@
+import hashlib
 import os
 from pathlib import Path
 import subprocess
 import time
 from typing import List
 from lpp_collector.config import (
+    DOCKER_DOCS_IMAGE,
     DOCKER_IMAGE,
+    LPP_CONTAINER_POOL,
     LPP_DATA_DIR,
+    LPP_DOCS_UPDATE_MARKER,
     LPP_UPDATE_INTERVAL,
     LPP_UPDATE_MARKER,
     TARGETPATH,
 )
+from lpp_collector.sync import sync_in, volume_name
 import sys
 
+POOL_LABEL = "lpp_collector.pool"
+ENTRYPOINT = "/usr/local/bin/lpp-entrypoint"
+SCRATCH_DIR = "/lpp/scratch"
 
-def run_test_container(args: List[str]):
-    data_dir = str(Path(LPP_DATA_DIR).absolute())
-    os.makedirs(data_dir, exist_ok=True)
-    target_path = str(Path(TARGETPATH).absolute())
+# ホストで設定されていればコンテナ内に引き継ぐ環境変数
+FORWARDED_ENV = [
+    "LPP_OUTPUT_LIMIT",
+    "LPP_MEMORY_LIMIT",
+    "LPP_CPU_LIMIT",
+    "LPP_BUILD_CACHE",
+    "LPP_BUILD_CACHE_ENTRIES",
+    "LPP_SOURCE_MAX_SIZE",
+    "LPP_SOURCE_FOLLOW_SYMLINKS",
+    "LPP_UPLOAD_MODE",
+    "LPP_UPLOAD_FORMAT",
+    "LPP_UPLOAD_DEDUP",
+    "LPP_UPLOAD_BUDGET",
+    "LPP_UPLOAD_TIMEOUT",
+    "LPP_UPLOAD_CONCURRENCY",
+    "LPP_UPLOAD_RETRIES",
+    "LPP_UPLOAD_BATCH",
+    "LPP_BREAKER_THRESHOLD",
+    "LPP_BREAKER_COOLDOWN",
+    "LPP_CONSENT_TIMEOUT",
+    "LPP_KEEP_ARTIFACTS",
+]
+
+
+def forwarded_env_args() -> List[str]:
+    env_args = []
+    for name in FORWARDED_ENV:
+        if name in os.environ:
+            env_args += ["--env", f"{name}={os.environ[name]}"]
+    return env_args
+
+
+def workspace_args(target_path: str, sync: bool) -> List[str]:
+    if not sync:
+        return ["-v", f"{target_path}:/workspaces"]
+
+    # ソースコードはボリューム (sync_in でコピーしたもの) から読み，テスト結果だけを書き戻す
+    result_dir = os.path.join(target_path, "test_results")
+    os.makedirs(result_dir, exist_ok=True)
+    return [
+        "-v",
+        f"{volume_name(target_path)}:/workspaces",
+        "-v",
+        f"{result_dir}:/workspaces/test_results",
+    ]
 
-    # print(f"Data directory: {data_dir}")
-    # print(f"Target path: {target_path}")
 
-    fix_perm_args = []
+def container_args(data_dir: str, target_path: str, sync: bool = False) -> List[str]:
+    user_args = []
 
     if not sys.platform.startswith("win"):
-        fix_perm_args = [
+        # コンテナ内ではこの UID/GID の利用者としてコマンドを実行する (docker/entrypoint.sh)
+        user_args = [
             "--env",
             f"TARGET_UID={os.getuid()}",
             "--env",
             f"TARGET_GID={os.getgid()}",
         ]
 
-    run_args = [
-        "run",
-        "-it",
-        "--rm",
-        "-v",
-        f"{target_path}:/workspaces",
+    return [
+        *workspace_args(target_path, sync),
         "-v",
         f"{data_dir}:/lpp/data",
-        # おまけ
-        "-v",
-        f"{data_dir}/bash_history:/root/.bash_history",
+        # テストケースの途中の出力はメモリ上に置き，必要なものだけ作業ディレクトリに書き戻す
+        "--tmpfs",
+        f"{SCRATCH_DIR}:rw,mode=1777",
         "-w",
         "/workspaces",
-        *fix_perm_args,
-        DOCKER_IMAGE,
+        *user_args,
+        *forwarded_env_args(),
+    ]
+
+
+def run_test_container(args: List[str], image: str = DOCKER_IMAGE, sync: bool = False):
+    data_dir = str(Path(LPP_DATA_DIR).absolute())
+    os.makedirs(data_dir, exist_ok=True)
+    target_path = str(Path(TARGETPATH).absolute())
+
+    # print(f"Data directory: {data_dir}")
+    # print(f"Target path: {target_path}")
+
+    if sync:
+        sync_in(target_path, image)
+
+    if LPP_CONTAINER_POOL and image == DOCKER_IMAGE:
+        exec_pool_container(args, data_dir, target_path, sync)
+        return
+
+    run_args = [
+        "run",
+        "-it",
+        "--rm",
+        *container_args(data_dir, target_path, sync),
+        image,
         *args,
     ]
 
@@ -53,73 +122,167 @@ def run_test_container(args: List[str]):
     subprocess.call(["docker", *run_args])
 
 
-def run_debug_build(base_dir: str):
+def pool_container_name(target_path: str, sync: bool = False) -> str:
+    # バインドマウントは起動時に固定されるため，作業ディレクトリ毎にコンテナを用意する
+    mode = ":sync" if sync else ""
+    digest = hashlib.sha1(f"{target_path}{mode}".encode("utf-8")).hexdigest()[:12]
+    return f"lpp_pool_{digest}"
+
+
+def inspect_image_id(image: str) -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["docker", "inspect", "--format", "{{.Id}}", image],
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("utf-8")
+            .strip("\n ")
+        )
+    except subprocess.CalledProcessError:
+        return ""
+
+
+def ensure_pool_container(name: str, data_dir: str, target_path: str, sync: bool):
+    try:
+        state = (
+            subprocess.check_output(
+                [
+                    "docker",
+                    "inspect",
+                    "--format",
+                    "{{.State.Running}} {{.Image}}",
+                    name,
+                ],
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("utf-8")
+            .split()
+        )
+    except subprocess.CalledProcessError:
+        state = []
+
+    if len(state) == 2:
+        running, image_id = state
+        if running == "true" and image_id == inspect_image_id(DOCKER_IMAGE):
+            return
+        # 停止している，またはイメージが更新された場合は作り直す
+        subprocess.call(
+            ["docker", "rm", "-f", name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    start_args = [
+        "run",
+        "-d",
+        "--name",
+        name,
+        "--label",
+        f"{POOL_LABEL}={target_path}",
+        "--init",
+        *container_args(data_dir, target_path, sync),
+        DOCKER_IMAGE,
+        "sleep",
+        "infinity",
+    ]
+    subprocess.check_call(["docker", *start_args], stdout=subprocess.DEVNULL)
+
+
+def exec_pool_container(
+    args: List[str], data_dir: str, target_path: str, sync: bool = False
+):
+    name = pool_container_name(target_path, sync)
+    ensure_pool_container(name, data_dir, target_path, sync)
+
+    exec_args = [
+        "exec",
+        "-it",
+        "-w",
+        "/workspaces",
+        *forwarded_env_args(),
+        name,
+        # docker exec では ENTRYPOINT が実行されないため，明示的に通す
+        ENTRYPOINT,
+        *args,
+    ]
+
+    subprocess.call(["docker", *exec_args])
+
+
+def stop_pool_containers():
+    container_ids = (
+        subprocess.check_output(
+            ["docker", "ps", "-aq", "--filter", f"label={POOL_LABEL}"]
+        )
+        .decode("utf-8")
+        .split()
+    )
+    if len(container_ids) > 0:
+        subprocess.call(["docker", "rm", "-f", *container_ids])
+
+
+def run_debug_build(base_dir: str, target: str = "runtime", image: str = DOCKER_IMAGE):
     build_args = [
         "buildx",
         "build",
+        "--target",
+        target,
         "-t",
-        DOCKER_IMAGE,
+        image,
         base_dir,
     ]
 
     subprocess.call(["docker", *build_args])
 
 
-def fix_permission():
-    if "TARGET_UID" not in os.environ or "TARGET_GID" not in os.environ:
-        return
-    target_uid = os.environ.get("TARGET_UID")
-    target_gid = os.environ.get("TARGET_GID")
-    subprocess.call(["chown", "-R", f"{target_uid}:{target_gid}", TARGETPATH])
-    subprocess.call(["chown", "-R", f"{target_uid}:{target_gid}", LPP_DATA_DIR])
-
-
-def write_update_marker():
-    with open(LPP_UPDATE_MARKER, "w") as f:
+def write_update_marker(marker: str = LPP_UPDATE_MARKER):
+    with open(marker, "w") as f:
         f.write(str(time.time()))
 
 
-def check_update():
-    if not os.path.exists(LPP_UPDATE_MARKER):
-        write_update_marker()
+def check_update(marker: str = LPP_UPDATE_MARKER):
+    if not os.path.exists(marker):
+        write_update_marker(marker)
         return True
 
-    last_update = os.path.getmtime(LPP_UPDATE_MARKER)
+    last_update = os.path.getmtime(marker)
     should_update = (time.time() - last_update) > LPP_UPDATE_INTERVAL
 
     if should_update:
-        write_update_marker()
+        write_update_marker(marker)
 
     return should_update
 
 
-def update(force: bool = False):
-    if not check_update() and not force:
+def update(
+    force: bool = False, image: str = DOCKER_IMAGE, marker: str = LPP_UPDATE_MARKER
+):
+    from lpp_collector.image_update import LOG_FILE, inspect_image, pull, update_image
+
+    if force:
+        print("Updating LPP test environment...")
+        write_update_marker(marker)
+        update_image(image)
+        print("Update complete.")
         return
 
-    print("Updating LPP test environment...")
-    try:
-        previous_image_id = (
-            subprocess.check_output(
-                ["docker", "inspect", "--format", "{{.Id}}", DOCKER_IMAGE]
-            )
-            .decode("utf-8")
-            .strip("\n ")
-        )
-    except subprocess.CalledProcessError:
-        previous_image_id = ""
+    if not check_update(marker):
+        return
 
-    subprocess.call(["docker", "pull", DOCKER_IMAGE])
-    current_image_id = (
-        subprocess.check_output(
-            ["docker", "inspect", "--format", "{{.Id}}", DOCKER_IMAGE]
-        )
-        .decode("utf-8")
-        .strip("\n ")
-    )
+    image_id, _ = inspect_image(image)
+    if image_id == "":
+        # 手元にイメージが無い場合は pull が終わるのを待つ
+        print("Downloading LPP test environment...")
+        pull(image)
+        return
+
+    # 今回は手元のイメージで実行し，更新があれば次回から使う
+    from lpp_collector.agent import spawn
+
+    spawn("lpp_collector.image_update", LOG_FILE, image)
 
-    if previous_image_id != current_image_id and previous_image_id != "":
-        print("Removing old image...")
-        subprocess.call(["docker", "rmi", previous_image_id])
 
-    print("Update complete.")
+def update_docs():
+    """lppdoxygen で使うイメージを用意する (初回は pull を待つ)"""
+    update(image=DOCKER_DOCS_IMAGE, marker=LPP_DOCS_UPDATE_MARKER)
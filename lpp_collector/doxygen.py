@@ -0,0 +1,32 @@
+"""lppdoxygen: ソースコードの Doxygen コメントから仕様書の PDF (spec.pdf) を作る
+
+doxygen と LaTeX は容量が大きいため，テストに使うイメージ (DOCKER_IMAGE) には含めず，
+ドキュメント用のイメージ (DOCKER_DOCS_IMAGE) を lppdoxygen の初回に pull して使う．
+"""
+
+import os
+import subprocess
+import sys
+
+from lpp_collector.config import DOCKER_DOCS_IMAGE, IS_DOCKER_ENV
+from .docker import run_debug_build, run_test_container, update_docs
+
+# ドキュメント用のイメージに含まれる PDF の生成スクリプト (docker/doxygen/genPDF.sh)
+GEN_PDF = "/usr/local/bin/lppdoxygen-pdf"
+
+
+def main():
+    if IS_DOCKER_ENV:
+        if not os.path.exists(GEN_PDF):
+            print(
+                "doxygen is not installed in this container, run lppdoxygen on the host",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        sys.exit(subprocess.call([GEN_PDF, *sys.argv[1:]]))
+
+    if "LPP_DOCKER_BASE" in os.environ:
+        run_debug_build(os.environ["LPP_DOCKER_BASE"], "docs", DOCKER_DOCS_IMAGE)
+    else:
+        update_docs()
+    run_test_container(["lppdoxygen", *sys.argv[1:]], image=DOCKER_DOCS_IMAGE)
@@ -0,0 +1,293 @@
+"""送信できなかったテスト結果の再送 (asyncio)
+
+1つの httpx.AsyncClient の接続を使い回し，LPP_UPLOAD_CONCURRENCY 件まで並行して送る．
+送信に失敗したものは指数的に間隔を空けて LPP_UPLOAD_RETRIES 回まで送り直す．
+
+- 接続できない場合 (オフライン) は，新たに送り始めるのをやめて False を返す
+- サーバがエラーを返した場合は，そのテスト結果の再送を後回しにして他のものを送り続ける
+- 接続できない状態が続いている場合 (breaker.py) は，接続を試みずに False を返す
+
+LPP_UPLOAD_BATCH 件ずつ1回のリクエスト (/api/testresult/{device_id}/bulk) にまとめて送る．
+サーバがこの API に対応していない場合は記録しておき，1件ずつ送る．
+まとめたリクエストが 4xx (413 など) で拒否された場合も，そのまとまりは1件ずつ送る．
+
+送れたものはその都度キューから削除するため，途中で中断しても次回は残りから再送する．
+他のプロセスが同じキューを送っている場合は，claim できたものだけを送る．
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from lpp_collector.breaker import CircuitBreaker
+from lpp_collector.config import (
+    LPP_BASE_URL,
+    LPP_UPLOAD_BATCH,
+    LPP_UPLOAD_CONCURRENCY,
+    LPP_UPLOAD_RETRIES,
+    LPP_UPLOAD_TIMEOUT,
+)
+from lpp_collector.payload import ARCHIVES
+from lpp_collector.sel_client.api.default import (
+    post_api_testresult_device_id,
+    post_api_testresult_device_id_bulk,
+)
+from lpp_collector.sel_client.client import Client
+from lpp_collector.sel_client.models import BulkTestResultRequest
+from lpp_collector.sel_client.types import File, Response
+from lpp_collector.snapshot import UNSUPPORTED_RECHECK_INTERVAL
+from lpp_collector.upload_queue import QueuedEntry, UploadQueue
+
+# 再送の間隔 (秒)．失敗する毎に倍にする
+RETRY_BASE_DELAY = 0.5
+# サーバがエラーを返したテスト結果を次に送るまでの間隔 (秒)
+DEFER_BASE_DELAY = 60
+DEFER_MAX_DELAY = 60 * 60
+# まとめて送る API に対応していないサーバの記録 (UploadQueue.get_meta のキー)
+BULK_UNSUPPORTED_KEY = "bulk_unsupported"
+
+
+def backoff(attempt: int, base: float) -> float:
+    """attempt 回目の再送までの時間 (同時に失敗したものが揃って再送しないよう揺らす)"""
+    delay = base * 2 ** (attempt - 1)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def build_bulk(entries: List[QueuedEntry]) -> BulkTestResultRequest:
+    """entries をまとめたリクエスト (同じソースコードは1つだけ送る)"""
+    results = []
+    sources: Dict[str, File] = {}
+    for entry in entries:
+        results.append(
+            {
+                "idempotencyKey": entry.idempotency_key,
+                "deviceTime": datetime.fromisoformat(entry.device_time).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "testType": entry.test_type,
+                "source": entry.source_hash,
+                "result": json.loads(entry.result),
+            }
+        )
+        if entry.source_hash not in sources:
+            suffix, mime_type = ARCHIVES[entry.upload_format]
+            # ファイルのまま渡し，送った後に close_bulk で閉じる
+            sources[entry.source_hash] = File(
+                payload=open(entry.source_path, "rb"),
+                file_name=f"{entry.source_hash}{suffix}",
+                mime_type=mime_type,
+            )
+    return BulkTestResultRequest(
+        results=File(
+            payload=BytesIO(json.dumps(results).encode()),
+            file_name="results.json",
+            mime_type="application/json",
+        ),
+        sources=list(sources.values()),
+    )
+
+
+def close_bulk(body: BulkTestResultRequest):
+    for file in body.sources:
+        file.payload.close()
+
+
+def bulk_supported(queue: UploadQueue) -> bool:
+    unsupported_at = queue.get_meta(f"{BULK_UNSUPPORTED_KEY} {LPP_BASE_URL}")
+    return (
+        unsupported_at is None
+        or time.time() - float(unsupported_at) > UNSUPPORTED_RECHECK_INTERVAL
+    )
+
+
+async def flush_queue(
+    queue: UploadQueue,
+    device_id: str,
+    stop: threading.Event,
+    concurrency: int = LPP_UPLOAD_CONCURRENCY,
+    retries: int = LPP_UPLOAD_RETRIES,
+    batch: int = LPP_UPLOAD_BATCH,
+) -> bool:
+    """キューのテスト結果を送る．サーバに接続できなかった場合は False"""
+    breaker = CircuitBreaker()
+    entry_ids = queue.ids(time.time())
+    if not entry_ids:
+        return True
+    if not breaker.allow():
+        return False
+
+    client = Client(base_url=LPP_BASE_URL, timeout=httpx.Timeout(LPP_UPLOAD_TIMEOUT))
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    offline = asyncio.Event()
+    reached = False
+    owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+    def stopped() -> bool:
+        return stop.is_set() or offline.is_set()
+
+    def defer(entry_id: int, error: str):
+        # このテスト結果だけが受け付けられないため，しばらく送らない
+        delay = min(DEFER_BASE_DELAY * 2 ** queue.attempts(entry_id), DEFER_MAX_DELAY)
+        queue.defer(entry_id, error, delay)
+
+    async def post(
+        request: Callable[[], Awaitable[Response]], rewind: Callable[[], None]
+    ) -> Tuple[Optional[Response], str]:
+        """送信し，再送できるエラーの場合は送り直す．(応答, エラー) を返す．
+        接続できなかった場合と中断した場合の応答は None
+        """
+        nonlocal reached
+        response, error = None, ""
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(backoff(attempt, RETRY_BASE_DELAY))
+                if stopped():
+                    return None, error
+            # 前回の送信で読み終えているため巻き戻す
+            rewind()
+            try:
+                response = await request()
+            except httpx.TransportError as e:
+                response, error = None, f"{type(e).__name__}: {e}"
+                continue
+
+            reached = True
+            error = f"HTTP {response.status_code}"
+            if not is_retryable(response.status_code):
+                break
+
+        if response is None:
+            offline.set()
+        return response, error
+
+    async def send(entry_id: int):
+        async with semaphore:
+            if stopped():
+                return
+            idempotency_key = queue.claim(entry_id, owner)
+            if idempotency_key is None:
+                # 他のプロセスが送っている
+                return
+            try:
+                await send_claimed(entry_id, idempotency_key)
+            finally:
+                queue.release(entry_id, owner)
+
+    async def send_claimed(entry_id: int, idempotency_key: str):
+        test_result = queue.get(entry_id)
+        if test_result is None:
+            return
+
+        with test_result.source_code.payload:
+            response, error = await post(
+                lambda: post_api_testresult_device_id.asyncio_detailed(
+                    device_id=device_id,
+                    client=client,
+                    body=test_result,
+                    idempotency_key=idempotency_key,
+                ),
+                lambda: test_result.source_code.payload.seek(0),
+            )
+        if response is None:
+            return
+        if response.status_code == 201:
+            queue.remove(entry_id)
+            return
+        defer(entry_id, error)
+
+    async def send_batch(entry_ids: List[int]) -> List[int]:
+        """まとめて送り，1件ずつ送り直すものを返す"""
+        async with semaphore:
+            if stopped():
+                return []
+            claimed = [
+                entry_id
+                for entry_id in entry_ids
+                if queue.claim(entry_id, owner) is not None
+            ]
+            try:
+                return await send_claimed_batch(claimed)
+            finally:
+                for entry_id in claimed:
+                    queue.release(entry_id, owner)
+
+    async def send_claimed_batch(entry_ids: List[int]) -> List[int]:
+        entries = []
+        for entry_id in entry_ids:
+            entry = queue.load(entry_id)
+            if entry is not None and entry.source_path is None:
+                # 壊れたものは get が削除する
+                queue.get(entry_id)
+            elif entry is not None:
+                entries.append(entry)
+        if len(entries) < 2:
+            return [entry.id for entry in entries]
+
+        try:
+            body = build_bulk(entries)
+        except OSError:
+            # 他のプロセスが削除した
+            return [entry.id for entry in entries]
+
+        def rewind():
+            for file in [body.results, *body.sources]:
+                file.payload.seek(0)
+
+        try:
+            response, error = await post(
+                lambda: post_api_testresult_device_id_bulk.asyncio_detailed(
+                    device_id=device_id, client=client, body=body
+                ),
+                rewind,
+            )
+        finally:
+            close_bulk(body)
+        if response is None:
+            return []
+        if response.status_code in (404, 405, 501):
+            queue.set_meta(f"{BULK_UNSUPPORTED_KEY} {LPP_BASE_URL}", str(time.time()))
+            return [entry.id for entry in entries]
+        queue.set_meta(f"{BULK_UNSUPPORTED_KEY} {LPP_BASE_URL}", None)
+        if 400 <= response.status_code < 500 and not is_retryable(response.status_code):
+            # リクエストが大きすぎる (413) か，一部のテスト結果が受け付けられない (400 など)．
+            # まとめて後回しにすると次回も同じ組み合わせで失敗し続けるため，1件ずつ送る
+            return [entry.id for entry in entries]
+
+        accepted = set()
+        if response.status_code == 200 and response.parsed is not None:
+            accepted = set(response.parsed.accepted)
+            error = "not accepted in bulk upload"
+        for entry in entries:
+            if entry.idempotency_key in accepted:
+                queue.remove(entry.id)
+            else:
+                defer(entry.id, error)
+        return []
+
+    async with client:
+        singles = entry_ids
+        if batch > 1 and len(entry_ids) > 1 and bulk_supported(queue):
+            batches = [
+                entry_ids[i : i + batch] for i in range(0, len(entry_ids), batch)
+            ]
+            fallback = await asyncio.gather(*(send_batch(ids) for ids in batches))
+            singles = [entry_id for ids in fallback for entry_id in ids]
+        await asyncio.gather(*(send(entry_id) for entry_id in singles))
+    if offline.is_set():
+        breaker.record_failure()
+    elif reached:
+        breaker.record_success()
+    return not offline.is_set()
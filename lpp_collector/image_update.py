@@ -0,0 +1,173 @@
+"""Docker イメージの更新の確認
+
+手元のイメージの digest (RepoDigests) とレジストリの manifest の digest を比べ，
+異なる場合だけ docker pull する．1日1回の確認は切り離したプロセスで行い，実行中の
+lpptest は手元のイメージをそのまま使う (pull が終われば次回から新しいイメージになる)．
+
+レジストリには Docker Registry HTTP API v2 で問い合わせる．認証が必要な場合
+(ghcr.io など) は匿名のトークンを取得する．localhost のレジストリには http で接続する．
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+
+from lpp_collector.config import DOCKER_IMAGE, LPP_DATA_DIR
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG_FILE = os.path.join(LPP_DATA_DIR, "image_update.log")
+# レジストリへの問い合わせのタイムアウト (秒)
+REGISTRY_TIMEOUT = 10
+DEFAULT_REGISTRY = "registry-1.docker.io"
+MANIFEST_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+]
+
+
+def parse_image(image: str) -> Tuple[str, str, str]:
+    """イメージ名を (レジストリ, リポジトリ, タグ) に分ける"""
+    name, _, tag = image.rpartition(":")
+    if not name or "/" in tag:
+        # タグが無い (: はレジストリのポート番号)
+        name, tag = image, "latest"
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        registry, repository = first, rest
+    else:
+        registry, repository = DEFAULT_REGISTRY, name
+        if "/" not in repository:
+            repository = f"library/{repository}"
+    return registry, repository, tag
+
+
+def registry_url(registry: str) -> str:
+    host = registry.rsplit(":", 1)[0]
+    scheme = "http" if host in ("localhost", "127.0.0.1") else "https"
+    return f"{scheme}://{registry}"
+
+
+def fetch_token(client: httpx.Client, challenge: str) -> Optional[str]:
+    """WWW-Authenticate: Bearer realm=...,service=...,scope=... から匿名のトークンを得る"""
+    if not challenge.lower().startswith("bearer "):
+        return None
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+    realm = params.pop("realm", None)
+    if realm is None:
+        return None
+    response = client.get(realm, params=params)
+    response.raise_for_status()
+    data = response.json()
+    return data.get("token") or data.get("access_token")
+
+
+def remote_digest(image: str = DOCKER_IMAGE) -> Optional[str]:
+    """レジストリ上の manifest の digest (問い合わせに失敗した場合は None)"""
+    registry, repository, tag = parse_image(image)
+    url = f"{registry_url(registry)}/v2/{repository}/manifests/{tag}"
+    headers = {"Accept": ", ".join(MANIFEST_TYPES)}
+    try:
+        with httpx.Client(timeout=REGISTRY_TIMEOUT, follow_redirects=True) as client:
+            response = client.head(url, headers=headers)
+            if response.status_code == 401:
+                token = fetch_token(
+                    client, response.headers.get("WWW-Authenticate", "")
+                )
+                if token is None:
+                    return None
+                headers["Authorization"] = f"Bearer {token}"
+                response = client.head(url, headers=headers)
+            if response.status_code != 200:
+                return None
+            return response.headers.get("Docker-Content-Digest")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def inspect_image(image: str = DOCKER_IMAGE) -> Tuple[str, List[str]]:
+    """手元のイメージの (ID, RepoDigests の digest)．無い場合は ("", [])"""
+    try:
+        output = subprocess.check_output(
+            [
+                "docker",
+                "image",
+                "inspect",
+                "--format",
+                "{{.Id}} {{json .RepoDigests}}",
+                image,
+            ],
+            stderr=subprocess.DEVNULL,
+        ).decode("utf-8")
+    except (subprocess.CalledProcessError, OSError):
+        return "", []
+    image_id, _, repo_digests = output.strip().partition(" ")
+    digests = [entry.rpartition("@")[2] for entry in json.loads(repo_digests or "[]")]
+    return image_id, digests
+
+
+def pull(image: str = DOCKER_IMAGE, quiet: bool = False) -> bool:
+    """docker pull し，置き換えられた古いイメージを削除する"""
+    previous_image_id, _ = inspect_image(image)
+    args = ["docker", "pull", *(["--quiet"] if quiet else []), image]
+    if subprocess.call(args) != 0:
+        return False
+
+    current_image_id, _ = inspect_image(image)
+    if previous_image_id != current_image_id and previous_image_id != "":
+        print("Removing old image...", flush=True)
+        # 古いイメージを使っているコンテナがある場合は削除できないが，次回以降に削除される
+        subprocess.call(
+            ["docker", "rmi", previous_image_id],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    return True
+
+
+def update_image(image: str = DOCKER_IMAGE, quiet: bool = False) -> bool:
+    """レジストリのイメージが手元のものと異なれば pull する．pull した場合は True"""
+    _, local_digests = inspect_image(image)
+    digest = remote_digest(image)
+    if digest is not None and digest in local_digests:
+        return False
+    if digest is None and local_digests:
+        # レジストリに問い合わせられない場合は，手元のイメージを使い続ける
+        print(f"{time.ctime()}: could not check {image}", flush=True)
+        return False
+    return pull(image, quiet)
+
+
+def lock_file(image: str) -> str:
+    digest = hashlib.sha1(image.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(LPP_DATA_DIR, f"image_update-{digest}.lock")
+
+
+def main():
+    image = sys.argv[1] if len(sys.argv) > 1 else DOCKER_IMAGE
+    os.makedirs(LPP_DATA_DIR, exist_ok=True)
+    with open(lock_file(image), "w") as lock:
+        if fcntl is not None:
+            try:
+                # 他のプロセスが確認している場合は任せる
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+        if update_image(image, quiet=True):
+            print(f"{time.ctime()}: updated {image}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
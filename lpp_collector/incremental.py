@@ -0,0 +1,168 @@
+"""変更のないテストケースの再実行を省略する (--incremental)
+
+実行ファイル，入力ファイル，期待される出力，テストケースのモジュールが前回成功した時から
+変わっていなければ，テストを実行せずに成功として扱う．判定に使う lpp_collector 自身や
+casljs，実行時の制限が変わった場合もキーが変わる．
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import pytest
+from _pytest.config import Config
+from _pytest.config.argparsing import Parser
+from _pytest.reports import TestReport
+
+from lpp_collector.config import (
+    LPP_CPU_LIMIT,
+    LPP_MEMORY_LIMIT,
+    LPP_OUTPUT_LIMIT,
+    LPP_RESULT_CACHE_DIR,
+    LPP_RESULT_CACHE_ENTRIES,
+    TARGETPATH,
+)
+
+CACHED_PROPERTY = ("lpp_incremental", "cached")
+# 04test で使う CASL2 の実行環境
+CASLJS_DIR = Path("/casljs")
+
+
+class IncrementalCache:
+    def __init__(self, config: Config):
+        self.config = config
+        self.cache_dir = Path(LPP_RESULT_CACHE_DIR)
+        self.keys: Dict[str, str] = {}
+        self.hits: Set[str] = set()
+        self.reused = 0
+        # (パス, サイズ, 更新日時) 毎のハッシュ
+        self.digests: Dict[Tuple[str, int, int], str] = {}
+        self._harness_digest: Optional[str] = None
+
+    def file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self.digests:
+            with open(path, "rb") as f:
+                self.digests[memo_key] = hashlib.sha256(f.read()).hexdigest()
+        return self.digests[memo_key]
+
+    def harness_digest(self) -> str:
+        """テストケース以外で判定に影響するもの (比較や実行の処理，制限) のハッシュ"""
+        if self._harness_digest is None:
+            package_dir = Path(__file__).parent
+            files = sorted(package_dir.glob("*.py"))
+            if CASLJS_DIR.is_dir():
+                files += sorted(CASLJS_DIR.glob("*.js"))
+            digest = hashlib.sha256(
+                f"{LPP_OUTPUT_LIMIT}\0{LPP_MEMORY_LIMIT}\0{LPP_CPU_LIMIT}".encode(
+                    "utf-8"
+                )
+            )
+            for path in files:
+                digest.update(f"\0{path}\0{self.file_digest(path)}".encode("utf-8"))
+            self._harness_digest = digest.hexdigest()
+        return self._harness_digest
+
+    def item_key(self, item: pytest.Item) -> Optional[str]:
+        """MPL ファイル毎のテストについて，結果に影響するファイルからキーを求める"""
+        callspec = getattr(item, "callspec", None)
+        module = getattr(item, "module", None)
+        if callspec is None or "mpl_file" not in callspec.params:
+            return None
+        target = getattr(module, "TARGET", None)
+        if target is None:
+            return None
+        binary = Path(TARGETPATH) / target
+        if not binary.is_file():
+            return None
+
+        mpl_file = Path(callspec.params["mpl_file"])
+        module_dir = Path(module.__file__).parent
+        expect_dir = Path(getattr(module, "TEST_EXPECT_DIR", "test_expects"))
+        if not expect_dir.is_absolute():
+            expect_dir = module_dir / expect_dir
+
+        files: List[Path] = [binary, mpl_file, Path(module.__file__)]
+        # テストケースのモジュールと同じディレクトリにあるデータ (04test の input.json など)
+        files += sorted(
+            entry
+            for entry in module_dir.iterdir()
+            if entry.is_file() and entry.suffix != ".py"
+        )
+        files += sorted(expect_dir.glob(f"{mpl_file.stem}.*"))
+
+        digest = hashlib.sha256(item.nodeid.encode("utf-8"))
+        digest.update(f"\0{self.harness_digest()}".encode("utf-8"))
+        for path in files:
+            digest.update(f"\0{path.name}\0{self.file_digest(path)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_pyfunc_call(self, pyfuncitem: pytest.Function):
+        key = self.item_key(pyfuncitem)
+        if key is None:
+            return None
+        self.keys[pyfuncitem.nodeid] = key
+        if (self.cache_dir / key).exists():
+            self.hits.add(pyfuncitem.nodeid)
+            # テスト関数を呼ばずに成功とする
+            return True
+        return None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item: pytest.Item, call):
+        outcome = yield
+        report: TestReport = outcome.get_result()
+        if report.when != "call" or item.nodeid not in self.keys:
+            return
+        if item.nodeid in self.hits:
+            report.user_properties.append(CACHED_PROPERTY)
+        elif report.passed:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            (self.cache_dir / self.keys[item.nodeid]).touch()
+
+    def pytest_runtest_logreport(self, report: TestReport):
+        # pytest-xdist の場合もコントローラ側で集計できるよう，レポートの内容で数える
+        if report.when == "call" and CACHED_PROPERTY in report.user_properties:
+            self.reused += 1
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.reused > 0:
+            terminalreporter.write_line(
+                f"incremental: {self.reused} unchanged testcase(s) reused from cache"
+            )
+
+    def pytest_sessionfinish(self, session):
+        if hasattr(self.config, "workerinput") or not self.cache_dir.exists():
+            return
+        prune(self.cache_dir)
+
+
+def prune(cache_dir: Path):
+    """古いものから削除し，エントリ数を LPP_RESULT_CACHE_ENTRIES 以下に保つ"""
+    entries = list(os.scandir(cache_dir))
+    if len(entries) <= LPP_RESULT_CACHE_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - LPP_RESULT_CACHE_ENTRIES]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def pytest_addoption(parser: Parser):
+    group = parser.getgroup("lpp_collector")
+    group.addoption(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Skip testcases whose binary, input and expected output are unchanged since they last passed",
+    )
+
+
+def pytest_configure(config: Config):  # pragma: no cover
+    if config.getoption("incremental"):
+        config.pluginmanager.register(IncrementalCache(config), "lpp_incremental_cache")
@@ -0,0 +1,137 @@
+"""テストスイート・入力ファイル・期待される出力の一覧 (manifest.json)
+
+パッケージのビルド時 (hatch_build.py) に生成しておき，テストケースや lpptest の起動時に
+ディレクトリを走査せずに済むようにする．manifest.json が無い場合 (開発中のソースツリーや
+LPP_TEST_BASE_DIR で別のディレクトリを指定した場合) はその場で走査する．
+
+ビルド時にはパッケージをインストールせずに読み込むため，標準ライブラリ以外は import しない．
+"""
+
+import json
+import os
+import re
+import sys
+from fnmatch import fnmatch
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# 04test などで実行時に与える入力
+INPUT_PARAMS_FILE = "input.json"
+
+
+def default_base_dir() -> str:
+    from lpp_collector.config import TEST_BASE_DIR
+
+    return TEST_BASE_DIR
+
+
+def read_error_line(expect_file: Path) -> Optional[int]:
+    """エラーメッセージの期待される出力に含まれる行番号"""
+    with open(expect_file, encoding="utf-8") as f:
+        match = re.search(r"(\d+)", f.read())
+    return int(match.group()) if match else None
+
+
+def build_manifest(base_dir: str) -> Dict[str, Any]:
+    """テストスイートのディレクトリを走査して manifest を作る"""
+    base = Path(base_dir)
+    manifest: Dict[str, Any] = {
+        "version": MANIFEST_VERSION,
+        "inputs": [],
+        "suites": {},
+    }
+    for entry in sorted(os.scandir(base), key=lambda entry: entry.name):
+        if not entry.is_dir() or entry.name.startswith((".", "__")):
+            continue
+        suite_dir = Path(entry.path)
+        manifest["inputs"] += sorted(
+            f"{entry.name}/{path.name}" for path in suite_dir.glob("*.mpl")
+        )
+
+        testcases = sorted(path.name for path in suite_dir.glob("*_test.py"))
+        if len(testcases) == 0:
+            continue
+
+        expects: Dict[str, Optional[int]] = {}
+        for expect_file in sorted((suite_dir / "test_expects").glob("*")):
+            expects[expect_file.name] = (
+                read_error_line(expect_file)
+                if expect_file.suffix == ".stderr"
+                else None
+            )
+
+        params: Dict[str, List[str]] = {}
+        if (suite_dir / INPUT_PARAMS_FILE).exists():
+            with open(suite_dir / INPUT_PARAMS_FILE, encoding="utf-8") as f:
+                params = json.load(f)
+
+        manifest["suites"][entry.name] = {
+            "testcases": testcases,
+            "expects": expects,
+            "params": params,
+        }
+    return manifest
+
+
+def write_manifest(base_dir: str, output: Optional[str] = None) -> str:
+    output = output or os.path.join(base_dir, MANIFEST_FILE)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(build_manifest(base_dir), f, ensure_ascii=False, indent=1)
+    return output
+
+
+@lru_cache(maxsize=None)
+def load_manifest(base_dir: Optional[str] = None) -> Dict[str, Any]:
+    base_dir = base_dir or default_base_dir()
+    manifest_file = os.path.join(base_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return build_manifest(base_dir)
+
+
+def list_testsuites(base_dir: Optional[str] = None) -> Dict[str, List[str]]:
+    """テストスイート名とテストケースのファイル名の一覧"""
+    suites = load_manifest(base_dir)["suites"]
+    return {name: suite["testcases"] for name, suite in suites.items()}
+
+
+def list_inputs(pattern: str, base_dir: Optional[str] = None) -> List[str]:
+    """pattern (例: input0[12]/*.mpl) に一致する入力ファイルの絶対パス"""
+    base_dir = base_dir or default_base_dir()
+    return [
+        os.path.join(base_dir, path)
+        for path in load_manifest(base_dir)["inputs"]
+        if fnmatch(path, pattern)
+    ]
+
+
+def expected_error_line(expect_file) -> Optional[int]:
+    """期待されるエラーメッセージの行番号 (manifest に無ければファイルを読む)"""
+    expect_file = Path(expect_file)
+    suite = expect_file.parent.parent.name
+    expects = load_manifest()["suites"].get(suite, {}).get("expects", {})
+    if expect_file.name in expects:
+        return expects[expect_file.name]
+    return read_error_line(expect_file)
+
+
+def input_params(suite: str, name: str) -> List[str]:
+    """実行時に COMET II に与える入力"""
+    return list(
+        load_manifest()["suites"].get(suite, {}).get("params", {}).get(name, [])
+    )
+
+
+def main():
+    base_dir = sys.argv[1] if len(sys.argv) > 1 else default_base_dir()
+    print(f"Manifest written to {write_manifest(base_dir)}")
+
+
+if __name__ == "__main__":
+    main()
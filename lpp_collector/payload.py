@@ -0,0 +1,117 @@
+"""アップロードするテスト結果の圧縮と大きさの調整
+
+LPP_UPLOAD_FORMAT でソースコードの tar の圧縮形式を選ぶ．
+
+- tar: 圧縮しない (既定)
+- gzip: tar.gz
+- zstd: tar.zst (zstandard が無い場合は gzip)
+
+result (JSON) は LPP_UPLOAD_BUDGET で大きさを抑え，圧縮せずに送る
+(multipart/form-data の各部分の Content-Encoding は解釈しないサーバがあるため)．
+"""
+
+import json
+import sys
+import tarfile
+from typing import IO, Dict, List, Optional, Tuple
+
+from lpp_collector.sel_client.models.test_case_result import TestCaseResult
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+UPLOAD_FORMATS = ["tar", "gzip", "zstd"]
+
+# 形式毎の (tar のファイル名の拡張子, MIME タイプ)
+ARCHIVES: Dict[str, Tuple[str, Optional[str]]] = {
+    "tar": (".tar", None),
+    "gzip": (".tar.gz", "application/gzip"),
+    "zstd": (".tar.zst", "application/zstd"),
+}
+
+# 切り詰めたメッセージの末尾に付ける文字列
+TRUNCATED_MARK = "\n... (truncated)"
+
+
+def resolve_format(upload_format: str) -> str:
+    if upload_format not in UPLOAD_FORMATS:
+        print(
+            f"Unknown LPP_UPLOAD_FORMAT {upload_format!r}, using tar", file=sys.stderr
+        )
+        return "tar"
+    if upload_format == "zstd" and zstandard is None:
+        return "gzip"
+    return upload_format
+
+
+def write_tar(
+    fileobj: IO[bytes],
+    files: List[str],
+    upload_format: str,
+    arcnames: Optional[List[str]] = None,
+):
+    """files をまとめた tar を upload_format で圧縮して fileobj に書き込む"""
+    if arcnames is None:
+        arcnames = files
+
+    if upload_format == "zstd":
+        writer = zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+        with writer, tarfile.open(fileobj=writer, mode="w|") as tf:
+            for file, arcname in zip(files, arcnames):
+                tf.add(file, arcname=arcname)
+        return
+
+    mode = "w:gz" if upload_format == "gzip" else "w"
+    with tarfile.open(fileobj=fileobj, mode=mode) as tf:
+        for file, arcname in zip(files, arcnames):
+            tf.add(file, arcname=arcname)
+
+
+def archive_format(file_name: str) -> str:
+    """tar のファイル名から圧縮形式を求める"""
+    for upload_format, (suffix, _) in ARCHIVES.items():
+        if upload_format != "tar" and file_name.endswith(suffix):
+            return upload_format
+    return "tar"
+
+
+def encode_results(results: List[TestCaseResult]) -> bytes:
+    return json.dumps([result.to_dict() for result in results]).encode()
+
+
+def fit_budget(results: List[TestCaseResult], budget: int) -> List[TestCaseResult]:
+    """result (JSON) が budget バイト以下になるよう，長い失敗メッセージから切り詰める．
+
+    budget が 0 の場合は切り詰めない．
+    """
+    size = len(encode_results(results))
+    if budget <= 0 or size <= budget:
+        return results
+
+    def trimmed(cap: int) -> List[TestCaseResult]:
+        return [
+            TestCaseResult(
+                name=result.name,
+                passed=result.passed,
+                message=trim(result.message, cap),
+            )
+            for result in results
+        ]
+
+    # 収まるメッセージの長さの上限を二分探索で求める
+    low, high = 0, max(len(result.message) for result in results)
+    while low < high:
+        cap = (low + high + 1) // 2
+        if len(encode_results(trimmed(cap))) <= budget:
+            low = cap
+        else:
+            high = cap - 1
+    return trimmed(low)
+
+
+def trim(message: str, cap: int) -> str:
+    if len(message) <= cap:
+        return message
+    return message[: max(cap - len(TRUNCATED_MARK), 0)] + TRUNCATED_MARK
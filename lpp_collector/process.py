@@ -0,0 +1,184 @@
+"""学生のプログラムの実行と出力の取得"""
+
+import locale
+import os
+import resource
+import selectors
+import signal
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from lpp_collector.config import LPP_CPU_LIMIT, LPP_MEMORY_LIMIT, LPP_OUTPUT_LIMIT
+
+READ_CHUNK_SIZE = 65536
+
+# 学生のプログラムに引き継ぐ環境変数
+CHILD_ENV_KEYS = ["PATH", "HOME", "USER", "LANG", "LANGUAGE", "TERM", "TMPDIR", "TZ"]
+
+
+class OutputLimitExceeded(Exception):
+    """出力が上限を超えたため，プログラムを強制終了した"""
+
+    def __init__(self, cmd, output_limit: int, truncated: int):
+        super().__init__(
+            f"Output exceeded {output_limit} bytes and the program was killed "
+            f"({truncated} bytes truncated) [{' '.join(cmd)}]"
+        )
+        self.cmd = cmd
+        self.output_limit = output_limit
+        self.truncated = truncated
+
+
+@dataclass
+class CaptureResult:
+    """実行結果"""
+
+    args: object
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+def child_env() -> Dict[str, str]:
+    """学生のプログラムに渡す環境変数 (pytest や lpp_collector の設定は渡さない)"""
+    return {
+        key: value
+        for key, value in os.environ.items()
+        if key in CHILD_ENV_KEYS or key.startswith("LC_")
+    }
+
+
+def resource_limits(memory_limit: int, cpu_limit: int):
+    """資源制限の一覧 (0 の場合は制限しない)"""
+    limits = []
+    if memory_limit > 0:
+        limits.append((resource.RLIMIT_AS, (memory_limit, memory_limit)))
+    if cpu_limit > 0:
+        # soft limit で SIGXCPU，hard limit で SIGKILL
+        limits.append((resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1)))
+    return limits
+
+
+def set_limits(limits):
+    """子プロセスの exec 前に資源制限を設定する関数を返す"""
+
+    def preexec():
+        for kind, limit in limits:
+            resource.setrlimit(kind, limit)
+
+    return preexec
+
+
+def spawn(args: List[str], env: Dict[str, str], limits) -> subprocess.Popen:
+    # 制限は exec の前に設定する (起動後に設定すると，それまでに起動された子プロセスには
+    # 制限がかからない)．制限の無い場合だけ preexec_fn を指定せず，vfork で起動させる
+    return subprocess.Popen(
+        args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        preexec_fn=set_limits(limits) if limits else None,
+    )
+
+
+def kill_group(proc: subprocess.Popen):
+    # make から起動された gcc など，子プロセスが起動したプロセスもまとめて終了させる
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def decode(data: bytes) -> str:
+    # universal_newlines=True と同じく改行コードを \n に揃える
+    text = data.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def run_capture(
+    cmd: Sequence,
+    check: bool = False,
+    env: Optional[Dict[str, str]] = None,
+    output_limit: int = LPP_OUTPUT_LIMIT,
+    memory_limit: int = LPP_MEMORY_LIMIT,
+    cpu_limit: int = LPP_CPU_LIMIT,
+) -> CaptureResult:
+    """コマンド (引数のリスト) をシェルを介さずに実行し，stdout と stderr を読み込む．
+
+    stdout と stderr はそれぞれ output_limit バイトまで保持し，
+    超えた場合はプロセスを強制終了して OutputLimitExceeded を送出する．
+    """
+    args = [os.fspath(arg) for arg in cmd]
+    try:
+        proc = spawn(
+            args,
+            child_env() if env is None else env,
+            resource_limits(memory_limit, cpu_limit),
+        )
+    except OSError as exc:
+        # シェル経由で実行した場合と同様に，起動の失敗は stderr に出力されたものとして扱う
+        returncode = 127 if isinstance(exc, FileNotFoundError) else 126
+        result = CaptureResult(
+            args=args,
+            returncode=returncode,
+            stdout="",
+            stderr=f"{args[0]}: {exc.strerror}\n",
+        )
+        if check:
+            raise subprocess.CalledProcessError(
+                returncode, args, output=result.stdout, stderr=result.stderr
+            ) from exc
+        return result
+
+    out_fd, err_fd = proc.stdout.fileno(), proc.stderr.fileno()
+    buffers: Dict[int, List[bytes]] = {out_fd: [], err_fd: []}
+    sizes = {fd: 0 for fd in buffers}
+    # 上限を超えて読み捨てたバイト数 (stdout と stderr の合計)
+    truncated = 0
+    killed = False
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ)
+            selector.register(proc.stderr, selectors.EVENT_READ)
+            while selector.get_map():
+                for key, _ in selector.select():
+                    chunk = os.read(key.fd, READ_CHUNK_SIZE)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        continue
+                    room = (
+                        output_limit - sizes[key.fd] if output_limit > 0 else len(chunk)
+                    )
+                    if room > 0:
+                        buffers[key.fd].append(chunk[:room])
+                        sizes[key.fd] += min(room, len(chunk))
+                    if len(chunk) > room:
+                        truncated += len(chunk) - max(room, 0)
+                        if not killed:
+                            kill_group(proc)
+                            killed = True
+        returncode = proc.wait()
+    finally:
+        # pytest-timeout などで中断された場合もプロセスを残さない
+        if proc.poll() is None:
+            kill_group(proc)
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    if killed:
+        raise OutputLimitExceeded(args, output_limit, truncated)
+
+    result = CaptureResult(
+        args=args,
+        returncode=returncode,
+        stdout=decode(b"".join(buffers[out_fd])),
+        stderr=decode(b"".join(buffers[err_fd])),
+    )
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, args, output=result.stdout, stderr=result.stderr
+        )
+    return result
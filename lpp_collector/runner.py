@@ -2,75 +2,106 @@
 
 import subprocess
 import sys
+import tempfile
 from typing import List
 from lpp_collector.config import (
     LPP_DATA_DIR,
+    LPP_SYNC_MODE,
+    LPP_UPLOAD_MODE,
     TEST_BASE_DIR,
     IS_DOCKER_ENV,
 )
 import argcomplete, argparse
-import glob
 from pathlib import Path
-from .docker import fix_permission, run_test_container, run_debug_build, update
+from . import LOAD_REPORTS_ENV, SAVE_REPORTS_ENV
+from .manifest import list_testsuites
+from .docker import (
+    run_test_container,
+    run_debug_build,
+    stop_pool_containers,
+    update,
+)
 import os
 
+def testcase_completer(parsed_args, **kwargs):
+    # 補完時は指定済みのテストスイートからテストケースの候補を求める
+    testcases = list_testsuites().get(getattr(parsed_args, "testsuite", None), [])
+    return testcases + ["all"]
 
-all_testcases = [
-    Path(testcase)
-    for testcase in glob.glob(f"{TEST_BASE_DIR}/**/*_test.py", recursive=True)
-]
-all_testsuite_list = sorted(set([testcase.parent.name for testcase in all_testcases]))
 
+def build_parser(argv: List[str]) -> argparse.ArgumentParser:
+    testsuites = list_testsuites()
 
-base_parser = argparse.ArgumentParser(add_help=False)
-base_parser.add_argument(
-    "--run-pytest",
-    action="store_true",
-    help="Enforce running pytest even though not in Docker environment",
-)
-base_parser.add_argument(
-    "--update",
-    action="store_true",
-    help="Update Docker image and exit",
-)
-base_parser.add_argument(
-    "testsuite", choices=all_testsuite_list, help="Specify testsuite"
-)
+    base_parser = argparse.ArgumentParser(add_help=False)
+    base_parser.add_argument(
+        "--run-pytest",
+        action="store_true",
+        help="Enforce running pytest even though not in Docker environment",
+    )
+    base_parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Update Docker image and exit",
+    )
+    base_parser.add_argument(
+        "--stop-pool",
+        action="store_true",
+        help="Stop warm containers started by LPP_CONTAINER_POOL and exit",
+    )
+    base_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Run testcases in parallel with the given number of workers",
+    )
+    base_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip testcases whose binary, input and expected output are unchanged since they last passed",
+    )
+    base_parser.add_argument(
+        "testsuite", choices=sorted(testsuites), help="Specify testsuite", nargs="?"
+    )
 
-full_parser = argparse.ArgumentParser(parents=[base_parser])
-specified_testsuite = base_parser.parse_known_args()[0].testsuite
+    full_parser = argparse.ArgumentParser(parents=[base_parser])
+    specified_testsuite = base_parser.parse_known_args(argv)[0].testsuite
 
-if specified_testsuite in all_testsuite_list:
-    all_testcases = [
-        testcase
-        for testcase in all_testcases
-        if testcase.parent.name == specified_testsuite
-    ]
     full_parser.add_argument(
         "testcases",
-        choices=[testcase.name for testcase in all_testcases] + ["all"],
+        choices=testsuites.get(specified_testsuite, []) + ["all"],
         help="Specify testcase to run",
         default="all",
         nargs="?",
-    )
-else:
-    full_parser.add_argument(
-        "testcases",
-        help="Specify testcase to run",
-        choices=["all"],
-        default="all",
-        nargs="?",
-    )
-
-full_parser.add_argument("pytest_args", nargs=argparse.REMAINDER)
-
-argcomplete.autocomplete(full_parser)
+    ).completer = testcase_completer
+
+    full_parser.add_argument("pytest_args", nargs=argparse.REMAINDER)
+    return full_parser
+
+
+def pop_runner_args(args):
+    # "lpptest 04test --jobs 4" の形式では --jobs などが pytest_args 側に入ってしまうため取り出す
+    pytest_args: List[str] = []
+    rest = iter(args.pytest_args)
+    for arg in rest:
+        if arg == "--incremental":
+            args.incremental = True
+        elif arg in ("-j", "--jobs"):
+            args.jobs = int(next(rest, "1"))
+        elif arg.startswith("--jobs="):
+            args.jobs = int(arg.split("=", 1)[1])
+        else:
+            pytest_args.append(arg)
+    if args.incremental:
+        pytest_args.append("--incremental")
+    args.pytest_args = pytest_args
 
 
 def run_pytest(args):
     testsuite: str = args.testsuite
     testcases = [
-        testcase for testcase in all_testcases if testcase.parent.name == testsuite
+        Path(TEST_BASE_DIR) / testsuite / testcase
+        for testcase in list_testsuites().get(testsuite, [])
     ]
 
     if len(testcases) == 0:
@@ -91,19 +122,49 @@ def run_pytest(args):
 
     pwd = os.getcwd()
     os.environ["LPP_TARGET_PATH"] = pwd
-    subprocess.call(
-        [
-            "pytest",
-            *args.pytest_args,
-            *testcase_paths,
-        ],
-        cwd=TEST_BASE_DIR,
-    )
+
+    compile_paths = [path for path in testcase_paths if "_compile_" in Path(path).name]
+    run_paths = [path for path in testcase_paths if path not in compile_paths]
+
+    if args.jobs > 1 and len(compile_paths) > 0 and len(run_paths) > 0:
+        # コンパイルは並列化できないため先に実行し，残りをワーカーに分配する．
+        # 結果は1回分として送るよう，コンパイルのテストの結果は次の pytest に引き継ぐ
+        with tempfile.TemporaryDirectory(prefix="lpp-") as tmp_dir:
+            reports_file = os.path.join(tmp_dir, "compile_reports.json")
+            subprocess.call(
+                ["pytest", *args.pytest_args, *compile_paths],
+                cwd=TEST_BASE_DIR,
+                env={**os.environ, SAVE_REPORTS_ENV: reports_file},
+            )
+            subprocess.call(
+                [
+                    "pytest",
+                    "-n",
+                    str(args.jobs),
+                    *args.pytest_args,
+                    *run_paths,
+                ],
+                cwd=TEST_BASE_DIR,
+                env={**os.environ, LOAD_REPORTS_ENV: reports_file},
+            )
+    else:
+        subprocess.call(
+            [
+                "pytest",
+                *(["-n", str(args.jobs)] if args.jobs > 1 else []),
+                *args.pytest_args,
+                *testcase_paths,
+            ],
+            cwd=TEST_BASE_DIR,
+        )
     os.chdir(pwd)
 
 
 def main():
+    full_parser = build_parser(sys.argv[1:])
+    argcomplete.autocomplete(full_parser)
     args = full_parser.parse_args()
+    pop_runner_args(args)
 
     if not os.path.exists(LPP_DATA_DIR):
         os.mkdir(LPP_DATA_DIR)
@@ -112,6 +173,13 @@ def main():
         update(True)
         return
 
+    if args.stop_pool:
+        stop_pool_containers()
+        return
+
+    if args.testsuite is None:
+        full_parser.error("the following arguments are required: testsuite")
+
     if args.run_pytest or IS_DOCKER_ENV:
         run_pytest(args)
     else:
@@ -119,11 +187,12 @@ def main():
             run_debug_build(os.environ["LPP_DOCKER_BASE"])
         else:
             update()
-        run_test_container(["lpptest", *sys.argv[1:]])
+        run_test_container(["lpptest", *sys.argv[1:]], sync=LPP_SYNC_MODE)
+        if LPP_UPLOAD_MODE == "detached":
+            # コンテナ内で保存されたテスト結果は，データディレクトリを共有しているホスト側で送る
+            from .agent import spawn
 
-    if IS_DOCKER_ENV:
-        # Fix permissions
-        fix_permission()
+            spawn()
 
 
 def main_PYTHON_ARGCOMPLETE_OK():
@@ -0,0 +1,58 @@
+"""テストケースの途中の出力を tmpfs に置く
+
+テストケースは出力 (.out や 04test の .csl) を scratch_dir フィクスチャのディレクトリに書き込む．
+コンテナでは run_test_container がマウントした tmpfs (LPP_SCRATCH_DIR) にテストケース毎の
+ディレクトリを作り，テストケースが失敗した場合 (LPP_KEEP_ARTIFACTS=all の場合は全て) だけ
+作業ディレクトリの TEST_RESULT_DIR に書き戻す．バインドマウントへの小さな書き込みを減らす．
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from lpp_collector.config import LPP_KEEP_ARTIFACTS, LPP_SCRATCH_DIR, TEST_RESULT_DIR
+
+REPORT_ATTR = "lpp_scratch_report"
+
+
+def copy_back(scratch: Path, result_dir: Path):
+    """scratch 以下のファイルを同じ相対パスで result_dir にコピーする"""
+    for root, _, files in os.walk(scratch):
+        dest_dir = result_dir / Path(root).relative_to(scratch)
+        os.makedirs(dest_dir, exist_ok=True)
+        for name in files:
+            shutil.copyfile(os.path.join(root, name), dest_dir / name)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item: pytest.Item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when == "call":
+        # フィクスチャの後始末で結果を参照する
+        setattr(item, REPORT_ATTR, report)
+
+
+@pytest.fixture
+def scratch_dir(request):
+    """テストケースの出力を書き込むディレクトリ"""
+    if not LPP_SCRATCH_DIR:
+        os.makedirs(TEST_RESULT_DIR, exist_ok=True)
+        yield Path(TEST_RESULT_DIR)
+        return
+
+    os.makedirs(LPP_SCRATCH_DIR, exist_ok=True)
+    prefix = re.sub(r"[^\w.-]", "_", request.node.name)[:64] + "-"
+    scratch = Path(tempfile.mkdtemp(prefix=prefix, dir=LPP_SCRATCH_DIR))
+    try:
+        yield scratch
+    finally:
+        report = getattr(request.node, REPORT_ATTR, None)
+        failed = report is None or report.failed
+        if failed or LPP_KEEP_ARTIFACTS == "all":
+            copy_back(scratch, Path(TEST_RESULT_DIR))
+        shutil.rmtree(scratch, ignore_errors=True)
@@ -14,8 +14,11 @@ def _get_kwargs(
     device_id: str,
     *,
     body: TestResultRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
 ) -> dict[str, Any]:
     headers: dict[str, Any] = {}
+    if not isinstance(idempotency_key, Unset):
+        headers["Idempotency-Key"] = idempotency_key
 
     _kwargs: dict[str, Any] = {
         "method": "post",
@@ -55,11 +58,13 @@ def sync_detailed(
     *,
     client: AuthenticatedClient | Client,
     body: TestResultRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
 ) -> Response[Any]:
     """
     Args:
         device_id (str):
         body (TestResultRequest | Unset):
+        idempotency_key (str | Unset):
 
     Raises:
         errors.UnexpectedStatus: If the server returns an undocumented status code and Client.raise_on_unexpected_status is True.
@@ -72,6 +77,7 @@ def sync_detailed(
     kwargs = _get_kwargs(
         device_id=device_id,
         body=body,
+        idempotency_key=idempotency_key,
     )
 
     response = client.get_httpx_client().request(
@@ -86,11 +92,13 @@ async def asyncio_detailed(
     *,
     client: AuthenticatedClient | Client,
     body: TestResultRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
 ) -> Response[Any]:
     """
     Args:
         device_id (str):
         body (TestResultRequest | Unset):
+        idempotency_key (str | Unset):
 
     Raises:
         errors.UnexpectedStatus: If the server returns an undocumented status code and Client.raise_on_unexpected_status is True.
@@ -103,6 +111,7 @@ async def asyncio_detailed(
     kwargs = _get_kwargs(
         device_id=device_id,
         body=body,
+        idempotency_key=idempotency_key,
     )
 
     response = await client.get_async_httpx_client().request(**kwargs)
@@ -0,0 +1,129 @@
+from http import HTTPStatus
+from typing import Any
+from urllib.parse import quote
+
+import httpx
+
+from ... import errors
+from ...client import AuthenticatedClient, Client
+from ...models.snapshot_missing import SnapshotMissing
+from ...models.snapshot_request import SnapshotRequest
+from ...types import UNSET, Response, Unset
+
+
+def _get_kwargs(
+    device_id: str,
+    *,
+    body: SnapshotRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
+) -> dict[str, Any]:
+    headers: dict[str, Any] = {}
+    if not isinstance(idempotency_key, Unset):
+        headers["Idempotency-Key"] = idempotency_key
+
+    _kwargs: dict[str, Any] = {
+        "method": "post",
+        "url": "/api/testresult/{device_id}/snapshot".format(
+            device_id=quote(str(device_id), safe=""),
+        ),
+    }
+
+    if not isinstance(body, Unset):
+        _kwargs["files"] = body.to_multipart()
+
+    _kwargs["headers"] = headers
+    return _kwargs
+
+
+def _parse_response(
+    *, client: AuthenticatedClient | Client, response: httpx.Response
+) -> Any | SnapshotMissing | None:
+    if response.status_code == 201:
+        return None
+
+    if response.status_code == 409:
+        response_409 = SnapshotMissing.from_dict(response.json())
+
+        return response_409
+
+    if client.raise_on_unexpected_status:
+        raise errors.UnexpectedStatus(response.status_code, response.content)
+    else:
+        return None
+
+
+def _build_response(
+    *, client: AuthenticatedClient | Client, response: httpx.Response
+) -> Response[Any | SnapshotMissing]:
+    return Response(
+        status_code=HTTPStatus(response.status_code),
+        content=response.content,
+        headers=response.headers,
+        parsed=_parse_response(client=client, response=response),
+    )
+
+
+def sync_detailed(
+    device_id: str,
+    *,
+    client: AuthenticatedClient | Client,
+    body: SnapshotRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
+) -> Response[Any | SnapshotMissing]:
+    """
+    Args:
+        device_id (str):
+        body (SnapshotRequest | Unset):
+        idempotency_key (str | Unset):
+
+    Raises:
+        errors.UnexpectedStatus: If the server returns an undocumented status code and Client.raise_on_unexpected_status is True.
+        httpx.TimeoutException: If the request takes longer than Client.timeout.
+
+    Returns:
+        Response[Any | SnapshotMissing]
+    """
+
+    kwargs = _get_kwargs(
+        device_id=device_id,
+        body=body,
+        idempotency_key=idempotency_key,
+    )
+
+    response = client.get_httpx_client().request(
+        **kwargs,
+    )
+
+    return _build_response(client=client, response=response)
+
+
+async def asyncio_detailed(
+    device_id: str,
+    *,
+    client: AuthenticatedClient | Client,
+    body: SnapshotRequest | Unset = UNSET,
+    idempotency_key: str | Unset = UNSET,
+) -> Response[Any | SnapshotMissing]:
+    """
+    Args:
+        device_id (str):
+        body (SnapshotRequest | Unset):
+        idempotency_key (str | Unset):
+
+    Raises:
+        errors.UnexpectedStatus: If the server returns an undocumented status code and Client.raise_on_unexpected_status is True.
+        httpx.TimeoutException: If the request takes longer than Client.timeout.
+
+    Returns:
+        Response[Any | SnapshotMissing]
+    """
+
+    kwargs = _get_kwargs(
+        device_id=device_id,
+        body=body,
+        idempotency_key=idempotency_key,
+    )
+
+    response = await client.get_async_httpx_client().request(**kwargs)
+
+    return _build_response(client=client, response=response)
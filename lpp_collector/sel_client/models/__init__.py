@@ -1,12 +1,20 @@
 """Contains all the data models used in inputs/outputs"""
 
+from .bulk_test_result_request import BulkTestResultRequest
+from .bulk_test_result_response import BulkTestResultResponse
 from .device_grant_request import DeviceGrantRequest
+from .snapshot_missing import SnapshotMissing
+from .snapshot_request import SnapshotRequest
 from .test_case_result import TestCaseResult
 from .test_case_result_passed import TestCaseResultPassed
 from .test_result_request import TestResultRequest
 
 __all__ = (
+    "BulkTestResultRequest",
+    "BulkTestResultResponse",
     "DeviceGrantRequest",
+    "SnapshotMissing",
+    "SnapshotRequest",
     "TestCaseResult",
     "TestCaseResultPassed",
     "TestResultRequest",
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from io import BytesIO
+from typing import Any, TypeVar
+
+from attrs import define as _attrs_define
+from attrs import field as _attrs_field
+
+from .. import types
+from ..types import File
+
+T = TypeVar("T", bound="BulkTestResultRequest")
+
+
+@_attrs_define
+class BulkTestResultRequest:
+    """
+    Attributes:
+        results (File): JSON array of test results, each with idempotencyKey, deviceTime, testType, source (SHA-256 of
+            its source archive) and result
+        sources (list[File]): source archives referenced by results, each named by its SHA-256 followed by the archive
+            suffix
+    """
+
+    results: File
+    sources: list[File]
+    additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        results = self.results.to_tuple()
+
+        sources = []
+        for sources_item_data in self.sources:
+            sources_item = sources_item_data.to_tuple()
+
+            sources.append(sources_item)
+
+        field_dict: dict[str, Any] = {}
+        field_dict.update(self.additional_properties)
+        field_dict.update(
+            {
+                "results": results,
+                "sources": sources,
+            }
+        )
+
+        return field_dict
+
+    def to_multipart(self) -> types.RequestFiles:
+        files: types.RequestFiles = []
+
+        files.append(("results", self.results.to_tuple()))
+
+        for sources_item_element in self.sources:
+            files.append(("sources", sources_item_element.to_tuple()))
+
+        for prop_name, prop in self.additional_properties.items():
+            files.append((prop_name, (None, str(prop).encode(), "text/plain")))
+
+        return files
+
+    @classmethod
+    def from_dict(cls: type[T], src_dict: Mapping[str, Any]) -> T:
+        d = dict(src_dict)
+        results = File(payload=BytesIO(d.pop("results")))
+
+        sources = []
+        _sources = d.pop("sources")
+        for sources_item_data in _sources:
+            sources_item = File(payload=BytesIO(sources_item_data))
+
+            sources.append(sources_item)
+
+        bulk_test_result_request = cls(
+            results=results,
+            sources=sources,
+        )
+
+        bulk_test_result_request.additional_properties = d
+        return bulk_test_result_request
+
+    @property
+    def additional_keys(self) -> list[str]:
+        return list(self.additional_properties.keys())
+
+    def __getitem__(self, key: str) -> Any:
+        return self.additional_properties[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.additional_properties[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.additional_properties[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.additional_properties
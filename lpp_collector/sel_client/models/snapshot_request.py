@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import datetime
+import json
+from collections.abc import Mapping
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from attrs import define as _attrs_define
+from attrs import field as _attrs_field
+from dateutil.parser import isoparse
+
+from .. import types
+from ..types import File
+
+if TYPE_CHECKING:
+    from ..models.test_case_result import TestCaseResult
+
+
+T = TypeVar("T", bound="SnapshotRequest")
+
+
+@_attrs_define
+class SnapshotRequest:
+    """
+    Attributes:
+        device_time (datetime.datetime):
+        test_type (str):
+        manifest (File): JSON object mapping each source file path to the SHA-256 of its content
+        blobs (File): tar archive of the contents the server does not have yet, each member named by its SHA-256
+        result (list[TestCaseResult]):
+    """
+
+    device_time: datetime.datetime
+    test_type: str
+    manifest: File
+    blobs: File
+    result: list[TestCaseResult]
+    additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        device_time = self.device_time.strftime("%Y-%m-%dT%H:%M:%SZ").encode()
+
+        test_type = self.test_type
+
+        manifest = self.manifest.to_tuple()
+
+        blobs = self.blobs.to_tuple()
+
+        result = []
+        for result_item_data in self.result:
+            result_item = result_item_data.to_dict()
+            result.append(result_item)
+
+        field_dict: dict[str, Any] = {}
+        field_dict.update(self.additional_properties)
+        field_dict.update(
+            {
+                "deviceTime": device_time,
+                "testType": test_type,
+                "manifest": manifest,
+                "blobs": blobs,
+                "result": result,
+            }
+        )
+
+        return field_dict
+
+    def to_multipart(self) -> types.RequestFiles:
+        files: types.RequestFiles = []
+
+        files.append(("deviceTime", (None, self.device_time.strftime("%Y-%m-%dT%H:%M:%SZ").encode(), "text/plain")))
+
+        files.append(("testType", (None, str(self.test_type).encode(), "text/plain")))
+
+        files.append(("manifest", self.manifest.to_tuple()))
+
+        files.append(("blobs", self.blobs.to_tuple()))
+
+        _temp_result = []
+        for result_item_element in self.result:
+            _temp_result.append(result_item_element.to_dict())
+
+        files.append(("result", (None, json.dumps(_temp_result).encode(), "application/json")))
+
+        for prop_name, prop in self.additional_properties.items():
+            files.append((prop_name, (None, str(prop).encode(), "text/plain")))
+
+        return files
+
+    @classmethod
+    def from_dict(cls: type[T], src_dict: Mapping[str, Any]) -> T:
+        from ..models.test_case_result import TestCaseResult
+
+        d = dict(src_dict)
+        device_time = isoparse(d.pop("deviceTime"))
+
+        test_type = d.pop("testType")
+
+        manifest = File(payload=BytesIO(d.pop("manifest")))
+
+        blobs = File(payload=BytesIO(d.pop("blobs")))
+
+        result = []
+        _result = d.pop("result")
+        for result_item_data in _result:
+            result_item = TestCaseResult.from_dict(result_item_data)
+
+            result.append(result_item)
+
+        snapshot_request = cls(
+            device_time=device_time,
+            test_type=test_type,
+            manifest=manifest,
+            blobs=blobs,
+            result=result,
+        )
+
+        snapshot_request.additional_properties = d
+        return snapshot_request
+
+    @property
+    def additional_keys(self) -> list[str]:
+        return list(self.additional_properties.keys())
+
+    def __getitem__(self, key: str) -> Any:
+        return self.additional_properties[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.additional_properties[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.additional_properties[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.additional_properties
@@ -0,0 +1,122 @@
+"""ソースコードの差分送信 (内容の SHA-256 で重複を除く)
+
+ファイル毎の SHA-256 を manifest として送り，サーバがまだ持っていない内容だけを tar にまとめて
+送る．サーバに送った内容のハッシュと前回の manifest はデータディレクトリの
+snapshot_index.json に記録する．記録が古く，サーバが持っていない内容があった場合は 409 で
+その一覧が返るため，それらを加えて送り直す．
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from lpp_collector.config import LPP_SNAPSHOT_INDEX
+
+INDEX_VERSION = 1
+# 差分送信に対応していないサーバに再び試すまでの時間 (秒)
+UNSUPPORTED_RECHECK_INTERVAL = 60 * 60 * 24
+
+
+class SnapshotIndex:
+    def __init__(self, base_url: str, device_id: str, path: str = LPP_SNAPSHOT_INDEX):
+        self.path = path
+        self.base_url = base_url
+        self.device_id = device_id
+        # 相対パス毎の [サイズ, 更新日時, SHA-256]
+        self.files: Dict[str, list] = {}
+        # サーバが持っている内容の SHA-256
+        self.blobs: Set[str] = set()
+        # 前回送った manifest
+        self.manifest: Dict[str, str] = {}
+        self.unsupported_at: Optional[float] = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # サーバや端末が変わった場合は記録を使わない
+        if (
+            data.get("version") != INDEX_VERSION
+            or data.get("base_url") != self.base_url
+            or data.get("device_id") != self.device_id
+        ):
+            return
+        self.files = data.get("files", {})
+        self.blobs = set(data.get("blobs", []))
+        self.manifest = data.get("manifest", {})
+        self.unsupported_at = data.get("unsupported_at")
+
+    def save(self):
+        data = {
+            "version": INDEX_VERSION,
+            "base_url": self.base_url,
+            "device_id": self.device_id,
+            "files": self.files,
+            "blobs": sorted(self.blobs),
+            "manifest": self.manifest,
+            "unsupported_at": self.unsupported_at,
+        }
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # 並行して実行している他の pytest と衝突しないよう，書き終えてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot_index-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def supported(self) -> bool:
+        return (
+            self.unsupported_at is None
+            or time.time() - self.unsupported_at > UNSUPPORTED_RECHECK_INTERVAL
+        )
+
+    def mark_unsupported(self):
+        self.unsupported_at = time.time()
+        self.save()
+
+    def file_hash(self, path: str, relpath: str) -> str:
+        """ファイルの SHA-256 (サイズと更新日時が前回と同じなら記録したものを使う)"""
+        stat = os.stat(path)
+        cached = self.files.get(relpath)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        self.files[relpath] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def build_manifest(self, source_dir: str, files: Iterable[str]) -> Dict[str, str]:
+        """source_dir からの相対パスと内容の SHA-256 の対応"""
+        manifest = {}
+        for path in sorted(set(files)):
+            relpath = os.path.relpath(path, source_dir)
+            manifest[relpath] = self.file_hash(path, relpath)
+        # 削除されたファイルの記録は残さない
+        self.files = {relpath: self.files[relpath] for relpath in manifest}
+        return manifest
+
+    def missing(self, manifest: Dict[str, str]) -> List[str]:
+        """manifest のうちサーバが持っていない内容の SHA-256"""
+        return sorted(set(manifest.values()) - self.blobs)
+
+    def forget(self, hashes: Iterable[str]):
+        self.blobs -= set(hashes)
+
+    def commit(self, manifest: Dict[str, str]):
+        """manifest を送れたことを記録する"""
+        self.blobs |= set(manifest.values())
+        self.manifest = manifest
+        self.unsupported_at = None
+        self.save()
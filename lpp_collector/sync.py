@@ -0,0 +1,169 @@
+"""作業ディレクトリのソースコードをボリュームにコピーする (LPP_SYNC_MODE)
+
+macOS や Windows では，バインドマウントした作業ディレクトリへのアクセスがホストと VM の間の
+ファイル共有を通るため遅い．LPP_SYNC_MODE=1 の場合は，ソースコード (LPP_SOURCE_FILES に
+一致するもの) だけを作業ディレクトリ毎の名前付きボリュームにコピーし，ビルドとテストは
+ボリューム上で行う．test_results だけはバインドマウントして作業ディレクトリに書き戻す．
+
+コピーしたファイルのサイズ，更新日時，SHA-256 をデータディレクトリに記録しておき，
+次回は内容が変わったファイルだけを tar にまとめて送る．作業ディレクトリから無くなった
+ファイルはボリュームからも削除する．
+"""
+
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from typing import Dict, List, Tuple
+
+from lpp_collector.config import LPP_SYNC_INDEX_DIR
+from .walk import find_source_files
+
+# 相対パス -> [サイズ, 更新日時 (ns), SHA-256]
+SyncIndex = Dict[str, list]
+
+# ボリューム上で削除と展開を行うスクリプト (削除するファイルは引数で渡す)
+APPLY_SCRIPT = 'cd /workspaces && rm -f -- "$@" && tar --numeric-owner -xf -'
+
+
+def volume_name(target_path: str) -> str:
+    digest = hashlib.sha1(target_path.encode("utf-8")).hexdigest()[:12]
+    return f"lpp_sync_{digest}"
+
+
+def index_path(volume: str) -> str:
+    return os.path.join(LPP_SYNC_INDEX_DIR, f"{volume}.json")
+
+
+def load_index(path: str) -> SyncIndex:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(path: str, index: SyncIndex):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sync_index-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def volume_exists(volume: str) -> bool:
+    return (
+        subprocess.call(
+            ["docker", "volume", "inspect", volume],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        == 0
+    )
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan(target_path: str, index: SyncIndex) -> Tuple[SyncIndex, List[str], List[str]]:
+    """(新しい記録, 送るファイル, 削除するファイル)"""
+    new_index: SyncIndex = {}
+    changed: List[str] = []
+    # 送信しないもの (.lppignore や大きすぎるもの) もビルドには必要
+    for path in find_source_files(target_path, upload_filters=False):
+        relpath = os.path.relpath(path, target_path).replace(os.sep, "/")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        previous = index.get(relpath)
+        if previous is not None and previous[:2] == [stat.st_size, stat.st_mtime_ns]:
+            digest = previous[2]
+        else:
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+        new_index[relpath] = [stat.st_size, stat.st_mtime_ns, digest]
+        # 更新日時だけが変わった場合は送らない (make が再ビルドする必要はない)
+        if previous is None or previous[2] != digest:
+            changed.append(relpath)
+    removed = sorted(relpath for relpath in index if relpath not in new_index)
+    return new_index, changed, removed
+
+
+def build_archive(target_path: str, changed: List[str]) -> bytes:
+    # コンテナ内でテストを実行する利用者 (docker/entrypoint.sh) が書き込めるよう，
+    # ディレクトリも含めて所有者をホストの利用者にする
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    gid = os.getgid() if hasattr(os, "getgid") else 0
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        dirs = {"."}
+        for relpath in changed:
+            parent = os.path.dirname(relpath)
+            while parent:
+                dirs.add(parent)
+                parent = os.path.dirname(parent)
+        for name in sorted(dirs):
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.uid, info.gid = uid, gid
+            tar.addfile(info)
+        for relpath in changed:
+            path = os.path.join(target_path, relpath)
+            info = tar.gettarinfo(path, arcname=relpath)
+            info.uid, info.gid = uid, gid
+            info.uname = info.gname = ""
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+    return buffer.getvalue()
+
+
+def sync_in(target_path: str, image: str) -> str:
+    """target_path のソースコードをボリュームにコピーし，ボリューム名を返す"""
+    volume = volume_name(target_path)
+    path = index_path(volume)
+    # ボリュームが削除されていれば全て送り直す
+    index = load_index(path) if volume_exists(volume) else {}
+    new_index, changed, removed = plan(target_path, index)
+    if len(changed) == 0 and len(removed) == 0:
+        return volume
+
+    archive = build_archive(target_path, changed)
+    apply_args = [
+        "run",
+        "--rm",
+        "-i",
+        "--network",
+        "none",
+        "--entrypoint",
+        "sh",
+        "-v",
+        f"{volume}:/workspaces",
+        image,
+        "-c",
+        APPLY_SCRIPT,
+        "sh",
+        *removed,
+    ]
+    result = subprocess.run(["docker", *apply_args], input=archive)
+    if result.returncode != 0:
+        # 古いソースコードでテストしないよう，ここで止める
+        print("Failed to copy the source files into the container", file=sys.stderr)
+        sys.exit(1)
+
+    save_index(path, new_index)
+    return volume
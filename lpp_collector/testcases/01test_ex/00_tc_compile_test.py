@@ -7,7 +7,10 @@ from pathlib import Path
 import glob
 import subprocess
 
-from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.build import cached_build
+from lpp_collector.config import TARGETPATH, TEST_RESULT_DIR
+from lpp_collector.manifest import list_inputs
+from lpp_collector.process import run_capture
 
 # import pytest
 
@@ -21,14 +24,7 @@ class ScanError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         #        for line in result.stdout.splitlines():
         #            yield line
         return [result.stdout, result.stderr]
@@ -42,7 +38,7 @@ def common_task(mpl_file, out_file):
     try:
         #        tc = Path(__file__).parent.parent.joinpath("tc")
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
         out = []
         sout = exec_res.pop(0)
         serr = exec_res.pop(0)
@@ -78,10 +74,9 @@ def common_task(mpl_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = "test_expects"
 
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input01/*.mpl", recursive=True))
+test_data = list_inputs("input01/*.mpl")
 
 
 def test_compile():
@@ -89,9 +84,10 @@ def test_compile():
     cwd = os.getcwd()
     os.chdir(TARGETPATH)
     if os.path.isfile("Makefile") or os.path.isfile("makefile"):
-        exec_res = command("make")
+        build_cmd = ["make"]
     else:
-        exec_res = command(f"gcc -w -o {TARGET} *.c")
+        build_cmd = ["gcc", "-w", "-o", TARGET, *sorted(glob.glob("*.c"))]
+    exec_res = cached_build(TARGET, build_cmd)
     os.chdir(cwd)
     exec_res.pop(0)
     serr = exec_res.pop(0)
@@ -101,7 +97,7 @@ def test_compile():
 def test_no_param():
     """引数を付けずに実行するテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe}")
+    exec_res = command([exe])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "No error message when no parameter is given."
@@ -110,7 +106,7 @@ def test_no_param():
 def test_not_valid_file():
     """存在しないファイルを引数にした場合のテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe} hogehoge")
+    exec_res = command([exe, "hogehoge"])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "No error message when non existent file is given."
@@ -7,7 +7,10 @@ import sys
 import re
 from pathlib import Path
 
-from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.build import cached_build
+from lpp_collector.config import TARGETPATH, TEST_RESULT_DIR
+from lpp_collector.manifest import list_inputs
+from lpp_collector.process import run_capture
 
 # import pytest
 
@@ -21,14 +24,7 @@ class ParseError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         #        for line in result.stdout.splitlines():
         #            yield line
         return [result.stdout, result.stderr]
@@ -41,7 +37,7 @@ def common_task(mpl_file, out_file):
     """共通して実行するタスク"""
     try:
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
         out = []
         sout = exec_res.pop(0)
         serr = exec_res.pop(0)
@@ -72,15 +68,12 @@ def common_task(mpl_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = "test_expects"
 
 # 全てのテストデータ
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input0[12]/*.mpl", recursive=True))
+test_data = list_inputs("input0[12]/*.mpl")
 # エラーが出ないことが期待されるデータのみ
-test_valid_data = sorted(
-    glob.glob(f"{TEST_BASE_DIR}/input0[12]/sample[!0]*.mpl", recursive=True)
-)
+test_valid_data = list_inputs("input0[12]/sample[!0]*.mpl")
 
 
 def test_compile():
@@ -88,9 +81,10 @@ def test_compile():
     cwd = os.getcwd()
     os.chdir(TARGETPATH)
     if os.path.isfile("Makefile") or os.path.isfile("makefile"):
-        exec_res = command("make")
+        build_cmd = ["make"]
     else:
-        exec_res = command(f"gcc -w -o {TARGET} *.c")
+        build_cmd = ["gcc", "-w", "-o", TARGET, *sorted(glob.glob("*.c"))]
+    exec_res = cached_build(TARGET, build_cmd)
     os.chdir(cwd)
     exec_res.pop(0)
     serr = exec_res.pop(0)
@@ -100,7 +94,7 @@ def test_compile():
 def test_no_param():
     """引数を付けずに実行するテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe}")
+    exec_res = command([exe])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "No error message when no parameter is given."
@@ -109,7 +103,7 @@ def test_no_param():
 def test_not_valid_file():
     """存在しないファイルを引数にした場合のテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe} hogehoge")
+    exec_res = command([exe, "hogehoge"])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "No error message when non existent file is given."
@@ -2,16 +2,16 @@
 
 # 課題2では，1回実行した出力を再度入力として実行させても
 # 全く同一の出力が得られるべき
-import os
-import glob
 import subprocess
 import sys
 import re
 from pathlib import Path
-import itertools
 import pytest
 
-from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.compare import compare_files
+from lpp_collector.config import TARGETPATH
+from lpp_collector.manifest import list_inputs
+from lpp_collector.process import run_capture
 
 
 TARGET = "pp"
@@ -24,14 +24,7 @@ class ParseError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         #        for line in result.stdout.splitlines():
         #            yield line
         return [result.stdout, result.stderr]
@@ -44,7 +37,7 @@ def common_task(mpl_file, out_file):
     """共通して実行するタスク"""
     try:
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
         out = []
         sout = exec_res.pop(0)
         serr = exec_res.pop(0)
@@ -75,15 +68,12 @@ def common_task(mpl_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = Path(__file__).parent / Path("test_expects")
 
 # 全てのテストデータ
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input0[12]/*.mpl", recursive=True))
+test_data = list_inputs("input0[12]/*.mpl")
 # エラーが出ないことが期待されるデータのみ
-test_valid_data = sorted(
-    glob.glob(f"{TEST_BASE_DIR}/input0[12]/sample[!0]*.mpl", recursive=True)
-)
+test_valid_data = list_inputs("input0[12]/sample[!0]*.mpl")
 
 paramed_test_data = [
     pytest.param(mpl_file, id=Path(mpl_file).name) for mpl_file in test_valid_data
@@ -92,28 +82,19 @@ paramed_test_data = [
 
 @pytest.mark.timeout(10)
 @pytest.mark.parametrize(("mpl_file"), paramed_test_data)
-def test_idempotency(mpl_file):
+def test_idempotency(mpl_file, scratch_dir):
     """メタモーフィックテストによって，冪等性を確認"""
     # 自分自身が生成したソースコードを読み込ませると同じファイルを生成するはず．
-    if not Path(TEST_RESULT_DIR).exists():
-        os.mkdir(TEST_RESULT_DIR)
-    out_file = Path(TEST_RESULT_DIR).joinpath(Path(mpl_file).stem + ".out")
+    out_file = scratch_dir.joinpath(Path(mpl_file).stem + ".out")
     # 1回目の実行
     res = common_task(mpl_file, out_file)
     if res == 0:
-        out2_file = Path(TEST_RESULT_DIR).joinpath(Path(mpl_file).stem + ".out2")
+        out2_file = scratch_dir.joinpath(Path(mpl_file).stem + ".out2")
         # 2回目の実行
         res1 = common_task(out_file, out2_file)
         if res1 == 0:
-            with open(out2_file, encoding="utf-8") as ofp2, open(
-                out_file, encoding="utf-8"
-            ) as ofp1:
-                out_cont = ofp2.read().splitlines()
-                est_cont = ofp1.read().splitlines()
-            for out_line, est_line in itertools.zip_longest(
-                out_cont, est_cont, fillvalue=""
-            ):
-                assert out_line == est_line, "Line does not match."
+            result = compare_files(out2_file, out_file)
+            assert result.matched, result.message()
         else:
             # 実行結果がエラーになるのであれば，それはダメ
             assert False, "Pretty print idempotency is broken."
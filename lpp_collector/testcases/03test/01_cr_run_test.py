@@ -1,15 +1,15 @@
 """課題3用テスト"""
 
-import os
 import sys
 import re
 from pathlib import Path
-import glob
 import subprocess
-import itertools
 import pytest
 
-from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.compare import compare_files
+from lpp_collector.config import TARGETPATH
+from lpp_collector.manifest import expected_error_line, list_inputs
+from lpp_collector.process import run_capture
 
 TARGET = "cr"
 
@@ -21,14 +21,7 @@ class SemanticError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         return [result.stdout, result.stderr]
     except subprocess.CalledProcessError:
         print(f"外部プログラムの実行に失敗しました [{cmd}]", file=sys.stderr)
@@ -39,7 +32,7 @@ def common_task(mpl_file, out_file):
     """共通して実行するタスク"""
     try:
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
         out = []
         sout = exec_res.pop(0)
         serr = exec_res.pop(0)
@@ -74,10 +67,9 @@ def common_task(mpl_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = Path(__file__).parent / Path("test_expects")
 
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input0[123]/*.mpl", recursive=True))
+test_data = list_inputs("input0[123]/*.mpl")
 
 paramed_test_data = [
     pytest.param(mpl_file, id=Path(mpl_file).name) for mpl_file in test_data
@@ -86,32 +78,21 @@ paramed_test_data = [
 
 @pytest.mark.timeout(10)
 @pytest.mark.parametrize(("mpl_file"), paramed_test_data)
-def test_cr_run(mpl_file):
+def test_cr_run(mpl_file, scratch_dir):
     """準備したテストケースを全て実行する．"""
-    if not Path(TEST_RESULT_DIR).exists():
-        os.mkdir(TEST_RESULT_DIR)
-    out_file = Path(TEST_RESULT_DIR).joinpath(Path(mpl_file).stem + ".out")
+    out_file = scratch_dir.joinpath(Path(mpl_file).stem + ".out")
     res = common_task(mpl_file, out_file)
     if res == 0:
         expect_file = Path(TEST_EXPECT_DIR).joinpath(Path(mpl_file).stem + ".stdout")
-        with open(out_file, encoding="utf-8") as ofp, open(
-            expect_file, encoding="utf-8"
-        ) as efp:
-            out_cont = ofp.read().splitlines()
-            est_cont = efp.read().splitlines()
-            for out_line, est_line in itertools.zip_longest(
-                out_cont, est_cont, fillvalue=""
-            ):
-                assert out_line == est_line, "Line does not match."
+        result = compare_files(out_file, expect_file)
+        assert result.matched, result.message()
 
     else:
         expect_file = Path(TEST_EXPECT_DIR).joinpath(Path(mpl_file).stem + ".stderr")
-        with open(out_file, encoding="utf-8") as ofp, open(
-            expect_file, encoding="utf-8"
-        ) as efp:
+        with open(out_file, encoding="utf-8") as ofp:
             try:
                 o = int(re.search(r"(\d+)", ofp.read()).group())
-                e = int(re.search(r"(\d+)", efp.read()).group())
+                e = expected_error_line(expect_file)
                 assert o - 1 <= e <= o + 1, "Line number of error message is different."
             except IndexError:
                 assert False, "Line number does not appear in error message."
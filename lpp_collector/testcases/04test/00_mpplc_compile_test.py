@@ -8,7 +8,10 @@ import glob
 import subprocess
 import shutil
 
-from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.build import cached_build
+from lpp_collector.config import TARGETPATH, TEST_BASE_DIR, TEST_RESULT_DIR
+from lpp_collector.manifest import list_inputs
+from lpp_collector.process import run_capture
 
 # import pytest
 
@@ -22,14 +25,7 @@ class CompileError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         return [result.stdout, result.stderr]
     except subprocess.CalledProcessError:
         print(f"外部プログラムの実行に失敗しました [{cmd}]", file=sys.stderr)
@@ -41,7 +37,7 @@ def common_task(mpl_file, out_file):
     try:
         # mpplc = Path(__file__).parent.parent.joinpath("mpplc")
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
         cslfile = Path(Path(mpl_file).stem + ".csl")
         if not cslfile.exists():
             cslfile = Path(mpl_file).parent / Path(Path(mpl_file).stem + ".csl")
@@ -76,11 +72,10 @@ def common_task(mpl_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = "test_expects"
 CASL2_FILE_DIR = "casl2"
 
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input*/*.mpl", recursive=True))
+test_data = list_inputs("input*/*.mpl")
 
 
 def test_compile():
@@ -88,9 +83,10 @@ def test_compile():
     cwd = os.getcwd()
     os.chdir(TARGETPATH)
     if os.path.isfile("Makefile") or os.path.isfile("makefile"):
-        exec_res = command("make")
+        build_cmd = ["make"]
     else:
-        exec_res = command(f"gcc -w -o {TARGET} *.c")
+        build_cmd = ["gcc", "-w", "-o", TARGET, *sorted(glob.glob("*.c"))]
+    exec_res = cached_build(TARGET, build_cmd)
     os.chdir(cwd)
     exec_res.pop(0)
     serr = exec_res.pop(0)
@@ -100,7 +96,7 @@ def test_compile():
 def test_no_param():
     """引数を付けずに実行するテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe}")
+    exec_res = command([exe])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "パラーメータを与えない時にエラーがでません"
@@ -109,7 +105,7 @@ def test_no_param():
 def test_not_valid_file():
     """存在しないファイルを引数にした場合のテスト"""
     exe = Path(TARGETPATH) / Path(TARGET)
-    exec_res = command(f"{exe} hogehoge")
+    exec_res = command([exe, "hogehoge"])
     exec_res.pop(0)
     serr = exec_res.pop(0)
     assert serr, "存在しないファイル名を与えた時にエラーがでません"
@@ -119,7 +115,7 @@ def test_absolute_path_file():
     """絶対パスでファイルを指定した場合のテスト"""
     shutil.copy(f"{TEST_BASE_DIR}/input01/sample12.mpl", "/tmp/sample12.mpl")
     exe = Path(TARGETPATH) / Path(TARGET)
-    command(f"{exe} /tmp/sample12.mpl")
+    command([exe, "/tmp/sample12.mpl"])
     if os.path.isfile("./sample12.csl"):
         assert True
     elif os.path.isfile("/tmp/sample12.csl"):
@@ -132,7 +128,7 @@ def test_dotted_path_file():
     """ドットを含むパスでファイルを指定した場合のテスト"""
     shutil.copy(f"{TEST_BASE_DIR}/input01/sample12.mpl", "/tmp/test.success.mpl")
     exe = Path(TARGETPATH) / Path(TARGET)
-    command(f"{exe} /tmp/sample12.mpl")
+    command([exe, "/tmp/sample12.mpl"])
     if os.path.isfile("./test.success.mpl"):
         assert True
     elif os.path.isfile("/tmp/test.success.mpl"):
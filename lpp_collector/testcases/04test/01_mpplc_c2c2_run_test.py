@@ -2,14 +2,15 @@
 
 import os
 import re
-import json
 from pathlib import Path
-import glob
+import shutil
 import subprocess
-import itertools
 import pytest
 
+from lpp_collector.compare import compare_files
 from lpp_collector.config import TARGETPATH, TEST_BASE_DIR
+from lpp_collector.manifest import expected_error_line, input_params, list_inputs
+from lpp_collector.process import run_capture
 
 
 TARGET = "mpplc"
@@ -30,14 +31,7 @@ class Comet2ExecutionError(Exception):
 def command(cmd):
     """コマンドの実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        result = run_capture(cmd)
         return [result.stdout, result.stderr]
     except subprocess.CalledProcessError as exc:
         raise Comet2ExecutionError("Failed to execute COMET II") from exc
@@ -46,14 +40,8 @@ def command(cmd):
 def interactive_command(cmd):
     """対話コマンド実行"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
+        # node は起動時に大きな仮想アドレス空間を確保するため，メモリ制限はかけない
+        result = run_capture(cmd, check=True, memory_limit=0)
         for line in result.stdout.splitlines():
             yield line
     except subprocess.CalledProcessError as exc:
@@ -61,12 +49,12 @@ def interactive_command(cmd):
         raise Comet2ExecutionError("Failed to interactively execute COMET II") from exc
 
 
-def compile_task(mpl_file, out_file):
+def compile_task(mpl_file, out_file, casl2_dir):
     """コンパイルタスク"""
     try:
         # mpplc = Path(__file__).parent.parent.joinpath("mpplc")
         exe = Path(TARGETPATH) / Path(TARGET)
-        exec_res = command(f"{exe} {mpl_file}")
+        exec_res = command([exe, mpl_file])
 
         cslfile = None
         out = []
@@ -84,10 +72,9 @@ def compile_task(mpl_file, out_file):
         if cslfile is None:
             raise FileNotFoundError(".csl file not found.")
 
-        casl2dir = Path(__file__).parent / Path(CASL2_FILE_DIR)
-        casl2dir.mkdir(exist_ok=True)
-        casl2file = casl2dir / cslfile.name
-        cslfile.rename(casl2file)
+        casl2_dir.mkdir(parents=True, exist_ok=True)
+        # casl2_dir は tmpfs 上にあり，別のファイルシステムになる場合がある
+        shutil.move(str(cslfile), str(casl2_dir / cslfile.name))
         return 0
     except CompileError as exc:
         if re.search(r"sample0", mpl_file):
@@ -111,17 +98,12 @@ def execution_task(casl2_file, out_file):
     """c2c2実行タスク"""
     try:
         c2c2 = Path("/casljs") / Path("c2c2.js")
-        assembler_text = interactive_command(f"node {c2c2} -n -c -a {casl2_file}")
+        assembler_text = interactive_command(["node", c2c2, "-n", "-c", "-a", casl2_file])
         if "DEFINED SYMBOLS" not in assembler_text:
             raise Casl2AssembleError("Failed to compile")
-        input_path = Path(__file__).parent / Path("input.json")
-        with open(input_path, encoding="utf-8") as fp:
-            inp = json.load(fp)
-        inputparams = ""
-        if Path(casl2_file).name in inp.keys():
-            inputparams = " ".join(list(inp[Path(casl2_file).name]))
+        inputparams = input_params(Path(__file__).parent.name, Path(casl2_file).name)
         terminal_text = interactive_command(
-            f"node {c2c2} -n -q -r {casl2_file} {inputparams}"
+            ["node", c2c2, "-n", "-q", "-r", casl2_file, *inputparams]
         )
         with open(out_file, mode="w", encoding="utf-8") as fp:
             for line in terminal_text:
@@ -143,11 +125,10 @@ def execution_task(casl2_file, out_file):
 # pytest code
 # ===================================
 
-TEST_RESULT_DIR = f"{TARGETPATH}/test_results"
 TEST_EXPECT_DIR = Path(__file__).parent / Path("test_expects")
 CASL2_FILE_DIR = "casl2"
 
-test_data = sorted(glob.glob(f"{TEST_BASE_DIR}/input*/*.mpl", recursive=True))
+test_data = list_inputs("input*/*.mpl")
 paramed_test_data = [
     pytest.param(mpl_file, id=Path(mpl_file).name) for mpl_file in test_data
 ]
@@ -155,41 +136,25 @@ paramed_test_data = [
 
 @pytest.mark.timeout(15)
 @pytest.mark.parametrize(("mpl_file"), paramed_test_data)
-def test_mpplc_run(mpl_file):
+def test_mpplc_run(mpl_file, scratch_dir):
     """mpplcを実行する"""
-    if not Path(TEST_RESULT_DIR).exists():
-        os.mkdir(TEST_RESULT_DIR)
-    if not Path(CASL2_FILE_DIR).exists():
-        os.mkdir(CASL2_FILE_DIR)
-    out_file = Path(TEST_RESULT_DIR).joinpath(Path(mpl_file).name + ".out")
-    res = compile_task(mpl_file, out_file)
+    out_file = scratch_dir.joinpath(Path(mpl_file).name + ".out")
+    casl2_dir = scratch_dir / Path(CASL2_FILE_DIR)
+    res = compile_task(mpl_file, out_file, casl2_dir)
     if res == 0:
-        casl2file = (
-            Path(__file__).parent
-            / Path(CASL2_FILE_DIR)
-            / Path(Path(mpl_file).stem + ".csl")
-        )
+        casl2file = casl2_dir / Path(Path(mpl_file).stem + ".csl")
         assert os.path.getsize(casl2file) > 0, "No CASL code generated."
-        out_file = Path(TEST_RESULT_DIR) / Path(Path(casl2file).name + ".out")
+        out_file = scratch_dir / Path(Path(casl2file).name + ".out")
         execution_task(casl2file, out_file)
         expect_file = Path(TEST_EXPECT_DIR) / Path(Path(casl2file).name + ".out")
-        with open(out_file, encoding="utf-8") as ofp, open(
-            expect_file, encoding="utf-8"
-        ) as efp:
-            out_cont = ofp.read().splitlines()
-            est_cont = efp.read().splitlines()
-            for out_line, est_line in itertools.zip_longest(
-                out_cont, est_cont, fillvalue=""
-            ):
-                assert out_line == est_line, "Line does not match."
+        result = compare_files(out_file, expect_file)
+        assert result.matched, result.message()
     else:
         expect_file = Path(TEST_EXPECT_DIR) / Path(Path(mpl_file).name + ".stderr")
-        with open(out_file, encoding="utf-8") as ofp, open(
-            expect_file, encoding="utf-8"
-        ) as efp:
+        with open(out_file, encoding="utf-8") as ofp:
             try:
                 o = int(re.search(r"(\d+)", ofp.read()).group())
-                e = int(re.search(r"(\d+)", efp.read()).group())
+                e = expected_error_line(expect_file)
                 assert o - 1 <= e <= o + 1, "Line number of error message is different."
             except IndexError:
                 assert False, "Line number does not appear in error message."
@@ -0,0 +1,472 @@
+"""送信できなかったテスト結果の保存先 (SQLite)
+
+テスト結果は entries に1行ずつ保存し，ソースコードの tar は SHA-256 をファイル名にして
+LPP_UPLOAD_QUEUE_BLOB_DIR に保存する (同じソースコードで何度もテストした場合も1つだけ保存される)．
+tar はメモリに読み込まず，少しずつコピーし，送る際もファイルのまま渡す．
+以前の形式 (upload_queue/*.dat) は再送する前に取り込む．
+
+同じデータディレクトリを複数のプロセスが同時に使う場合に同じテスト結果を重複して送らないよう，
+送る前に claim で一定時間の貸し出し (lease) を受ける．送信中にプロセスが終了した場合は
+LEASE_DURATION 秒後に他のプロセスが送り直す．テスト結果毎の Idempotency-Key を送るため，
+サーバに届いた後に応答を受け取れずに送り直した場合も，サーバは重複を除ける．
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from pickle import load
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from lpp_collector.config import (
+    LPP_UPLOAD_QUEUE_BLOB_DIR,
+    LPP_UPLOAD_QUEUE_DB,
+    LPP_UPLOAD_QUEUE_DIR,
+)
+from lpp_collector.payload import archive_format
+from lpp_collector.sel_client.models import TestResultRequest
+from lpp_collector.sel_client.models.test_case_result import TestCaseResult
+from lpp_collector.sel_client.types import File
+
+# MIGRATIONS[i] でバージョン i から i + 1 に更新する
+MIGRATIONS = [
+    [
+        """CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created REAL NOT NULL,
+            device_time TEXT NOT NULL,
+            test_type TEXT NOT NULL,
+            upload_format TEXT NOT NULL,
+            source_name TEXT,
+            source_mime TEXT,
+            source_hash TEXT NOT NULL,
+            result TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS entries_source_hash ON entries (source_hash)",
+    ],
+    # 再送の状況 (失敗した回数，次に送ってよい時刻，最後のエラー)
+    [
+        "ALTER TABLE entries ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE entries ADD COLUMN next_attempt REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE entries ADD COLUMN last_error TEXT",
+    ],
+    # 重複送信の防止 (Idempotency-Key と，送信中のプロセスへの貸し出し)
+    [
+        "ALTER TABLE entries ADD COLUMN idempotency_key TEXT",
+        "UPDATE entries SET idempotency_key = lower(hex(randomblob(16)))"
+        " WHERE idempotency_key IS NULL",
+        "ALTER TABLE entries ADD COLUMN lease_owner TEXT",
+        "ALTER TABLE entries ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+    ],
+    # サーバ毎の送信方法の記録 (まとめて送る API に対応しているかなど)
+    [
+        """CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )""",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# 空き領域がこの割合を超えたら compact で VACUUM する
+VACUUM_FREE_RATIO = 0.25
+# ロックされている場合に待つ時間 (秒)
+BUSY_TIMEOUT = 10
+# 以前の形式のファイルを取り込み中であることを示す名前 (他のプロセスに取り込ませない)
+LEGACY_CLAIMED_SUFFIX = ".claimed"
+# 送信のために貸し出す時間 (秒)．再送を含めた1件の送信はこれより十分短い
+LEASE_DURATION = 10 * 60
+# ソースコードを書き出し中のファイル
+TMP_BLOB_PREFIX = ".tmp-"
+# 書き出し中のファイルがこの時間 (秒) より古い場合は，書き出したプロセスが終了している
+TMP_BLOB_MAX_AGE = 10 * 60
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class QueuedEntry(NamedTuple):
+    """保存されたテスト結果 (result は JSON，source_path はソースコードの tar のファイル)"""
+
+    id: int
+    device_time: str
+    test_type: str
+    upload_format: str
+    source_name: Optional[str]
+    source_mime: Optional[str]
+    source_hash: str
+    source_path: Optional[str]
+    result: str
+    idempotency_key: str
+
+
+def migrate(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 他のプロセスが更新済みの場合もあるため，ロックを取ってから読み直す
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class UploadQueue:
+    def __init__(
+        self,
+        path: str = LPP_UPLOAD_QUEUE_DB,
+        legacy_dir: str = LPP_UPLOAD_QUEUE_DIR,
+        blob_dir: str = LPP_UPLOAD_QUEUE_BLOB_DIR,
+    ):
+        self.path = path
+        self.legacy_dir = Path(legacy_dir)
+        self.blob_dir = Path(blob_dir)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        # スレッド毎・操作毎に接続する (バックグラウンドでの再送と並行して使うため)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            conn = self._open()
+        except sqlite3.DatabaseError as e:
+            # 壊れたファイルは退避して作り直す
+            print(
+                f"Upload queue {self.path} is broken ({e}), recreating", file=sys.stderr
+            )
+            os.replace(self.path, f"{self.path}.corrupt")
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        try:
+            # ホストの送信用のプロセスとコンテナの pytest が Docker Desktop のバインドマウント越しに
+            # 同じファイルを開くため，共有メモリを使う WAL ではなく DELETE モードにする
+            conn.execute("PRAGMA journal_mode=DELETE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                migrate(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def blob_path(self, source_hash: str) -> Path:
+        return self.blob_dir / source_hash
+
+    def _write_blob(self, payload: BinaryIO) -> Tuple[str, str]:
+        """payload を一時ファイルに書き出し，(SHA-256, 一時ファイルのパス) を返す"""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=TMP_BLOB_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: payload.read(COPY_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest.hexdigest(), tmp_path
+
+    def _place_blob(self, tmp_path: str, source_hash: str):
+        """書き出したファイルを置く (同じ内容のものがあればそれを使う)"""
+        if not self.blob_path(source_hash).exists():
+            os.replace(tmp_path, self.blob_path(source_hash))
+
+    def _unlink_blob(self, source_hash: str):
+        try:
+            os.unlink(self.blob_path(source_hash))
+        except OSError:
+            # 送信中で開かれている (Windows) 場合などは compact で削除する
+            pass
+
+    def put(
+        self, test_result: TestResultRequest, idempotency_key: Optional[str] = None
+    ) -> int:
+        """テスト結果を保存する．送信を試みた後の場合は，その際の idempotency_key を渡す"""
+        source_code = test_result.source_code
+        source_code.payload.seek(0)
+        source_hash, tmp_path = self._write_blob(source_code.payload)
+        result = json.dumps([item.to_dict() for item in test_result.result])
+
+        try:
+            with self.transaction() as conn:
+                # remove や compact が削除するのと同じロックの中で置く
+                self._place_blob(tmp_path, source_hash)
+                cursor = conn.execute(
+                    "INSERT INTO entries (created, device_time, test_type,"
+                    " upload_format, source_name, source_mime, source_hash, result,"
+                    " idempotency_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        datetime.now().timestamp(),
+                        test_result.device_time.isoformat(),
+                        test_result.test_type,
+                        archive_format(source_code.file_name or ""),
+                        source_code.file_name,
+                        source_code.mime_type,
+                        source_hash,
+                        result,
+                        idempotency_key or str(uuid.uuid4()),
+                    ),
+                )
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return cursor.lastrowid
+
+    def ids(self, ready_at: Optional[float] = None) -> List[int]:
+        """送信待ちのテスト結果 (古い順)．ready_at を指定した場合はその時刻に送ってよいもの
+        (他のプロセスが送信中のものを除く) のみ
+        """
+        with self.connect() as conn:
+            if ready_at is None:
+                rows = conn.execute("SELECT id FROM entries ORDER BY id")
+            else:
+                rows = conn.execute(
+                    "SELECT id FROM entries WHERE next_attempt <= ?"
+                    " AND lease_until <= ? ORDER BY id",
+                    (ready_at, ready_at),
+                )
+            return [row[0] for row in rows]
+
+    def load(self, entry_id: int) -> Optional[QueuedEntry]:
+        """保存されたままの形で読み込む．既に削除されている場合は None"""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT id, device_time, test_type, upload_format, source_name,"
+                " source_mime, source_hash, result, idempotency_key"
+                " FROM entries WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        entry_id, device_time, test_type, upload_format, source_name = row[:5]
+        source_mime, source_hash, result, idempotency_key = row[5:]
+        source_path = self.blob_path(source_hash)
+        return QueuedEntry(
+            id=entry_id,
+            device_time=device_time,
+            test_type=test_type,
+            upload_format=upload_format,
+            source_name=source_name,
+            source_mime=source_mime,
+            source_hash=source_hash,
+            source_path=str(source_path) if source_path.exists() else None,
+            result=result,
+            idempotency_key=idempotency_key,
+        )
+
+    def get(self, entry_id: int) -> Optional[TestResultRequest]:
+        """テスト結果を読み込む．既に削除されている場合や，壊れている場合は None"""
+        entry = self.load(entry_id)
+        if entry is None:
+            return None
+
+        try:
+            if entry.source_path is None:
+                raise ValueError("source archive is missing")
+            # 送った後に閉じるのは呼び出し側 (flush) で行う
+            payload = open(entry.source_path, "rb")
+        except (ValueError, OSError) as e:
+            print(f"Discarding broken upload entry {entry_id}: {e}", file=sys.stderr)
+            self.remove(entry_id)
+            return None
+
+        try:
+            return TestResultRequest(
+                device_time=datetime.fromisoformat(entry.device_time),
+                test_type=entry.test_type,
+                result=[
+                    TestCaseResult.from_dict(item) for item in json.loads(entry.result)
+                ],
+                testcases=File(payload=BytesIO(), file_name="source.tar"),
+                source_code=File(
+                    payload=payload,
+                    file_name=entry.source_name,
+                    mime_type=entry.source_mime,
+                ),
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            # 壊れたものは送れないため削除し，他のテスト結果の送信を続ける
+            payload.close()
+            print(f"Discarding broken upload entry {entry_id}: {e}", file=sys.stderr)
+            self.remove(entry_id)
+            return None
+
+    def claim(
+        self, entry_id: int, owner: str, duration: float = LEASE_DURATION
+    ) -> Optional[str]:
+        """テスト結果を duration 秒の間 owner に貸し出し，その Idempotency-Key を返す．
+        削除されている場合や，他のプロセスに貸し出し中の場合は None
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE entries SET lease_owner = ?, lease_until = ?"
+                " WHERE id = ? AND (lease_until <= ? OR lease_owner = ?)",
+                (owner, now + duration, entry_id, now, owner),
+            )
+            if cursor.rowcount == 0:
+                return None
+            return conn.execute(
+                "SELECT idempotency_key FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()[0]
+
+    def release(self, entry_id: int, owner: str):
+        """claim で受けた貸し出しを返す (他のプロセスに貸し出し直されている場合は何もしない)"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE entries SET lease_owner = NULL, lease_until = 0"
+                " WHERE id = ? AND lease_owner = ?",
+                (entry_id, owner),
+            )
+
+    def defer(self, entry_id: int, error: str, delay: float):
+        """送信に失敗したことを記録し，delay 秒後まで再送しない"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE entries SET attempts = attempts + 1, next_attempt = ?,"
+                " last_error = ?, lease_owner = NULL, lease_until = 0 WHERE id = ?",
+                (time.time() + delay, error, entry_id),
+            )
+
+    def attempts(self, entry_id: int) -> int:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+        return 0 if row is None else row[0]
+
+    def remove(self, entry_id: int):
+        """テスト結果を削除し，他から参照されていないソースコードも削除する"""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT source_hash FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+                referenced = conn.execute(
+                    "SELECT 1 FROM entries WHERE source_hash = ? LIMIT 1", (row[0],)
+                ).fetchone()
+                if referenced is None:
+                    self._unlink_blob(row[0])
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: Optional[str]):
+        """value が None の場合は削除する"""
+        with self.transaction() as conn:
+            if value is None:
+                conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (key, value),
+                )
+
+    def compact(self):
+        """参照されていないソースコードを削除し，空き領域が多ければ VACUUM する"""
+        with self.transaction() as conn:
+            referenced = {
+                row[0] for row in conn.execute("SELECT source_hash FROM entries")
+            }
+            try:
+                files = list(os.scandir(self.blob_dir))
+            except FileNotFoundError:
+                files = []
+            for file in files:
+                if file.name.startswith(TMP_BLOB_PREFIX):
+                    # 書き出し中に終了したプロセスのもの
+                    try:
+                        if time.time() - file.stat().st_mtime > TMP_BLOB_MAX_AGE:
+                            os.unlink(file.path)
+                    except OSError:
+                        pass
+                elif file.name not in referenced:
+                    self._unlink_blob(file.name)
+
+        with self.connect() as conn:
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count > 0 and freelist_count / page_count > VACUUM_FREE_RATIO:
+                conn.execute("VACUUM")
+
+    def import_legacy(self) -> int:
+        """以前の形式 (upload_queue/*.dat) のテスト結果を取り込み，取り込んだ数を返す"""
+        if not self.legacy_dir.exists():
+            return 0
+
+        # 取り込み中に終了したプロセスのものは取り込み直す
+        for claimed in self.legacy_dir.glob(f"*.dat.*{LEGACY_CLAIMED_SUFFIX}"):
+            try:
+                if time.time() - claimed.stat().st_mtime > LEASE_DURATION:
+                    original = claimed.name.split(".dat.")[0] + ".dat"
+                    claimed.replace(self.legacy_dir / original)
+            except FileNotFoundError:
+                continue
+
+        imported = 0
+        for file in sorted(self.legacy_dir.glob("*.dat")):
+            # 先に名前を変えられたプロセスだけが取り込む (他のプロセスと重複して取り込まない)
+            claimed = file.with_name(
+                f"{file.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}{LEGACY_CLAIMED_SUFFIX}"
+            )
+            try:
+                file.rename(claimed)
+            except FileNotFoundError:
+                # 他のプロセスが取り込んだ
+                continue
+            except OSError as e:
+                # 名前を変えられないものは残し，次回取り込み直す
+                print(f"Cannot import upload entry {file}: {e}", file=sys.stderr)
+                continue
+
+            try:
+                with open(claimed, "rb") as f:
+                    test_result = load(f)
+            except Exception as e:
+                # 読み込めないものは退避し，他のテスト結果の取り込みを続ける
+                print(f"Skipping broken upload entry {file}: {e}", file=sys.stderr)
+                claimed.replace(file.with_suffix(".corrupt"))
+                continue
+
+            self.put(test_result)
+            claimed.unlink()
+            imported += 1
+
+        # 取り込みが終わったディレクトリは削除する
+        try:
+            os.rmdir(self.legacy_dir)
+        except OSError:
+            pass
+        return imported
@@ -1,30 +1,59 @@
-from pathlib import Path
-from lpp_collector.config import LPP_BASE_URL, LPP_DATA_DIR, LPP_SOURCE_FILES
+from lpp_collector.config import (
+    LPP_BASE_URL,
+    LPP_UPLOAD_BUDGET,
+    LPP_UPLOAD_DEDUP,
+    LPP_UPLOAD_FORMAT,
+    LPP_UPLOAD_TIMEOUT,
+)
 from lpp_collector.sel_client.models.test_case_result import TestCaseResult
 from lpp_collector.sel_client.models.test_case_result_passed import TestCaseResultPassed
 from lpp_collector.sel_client.types import File
 from .sel_client.client import Client
-from .sel_client.api.default import post_api_testresult_device_id
-from .sel_client.models import TestResultRequest
-from glob import glob
+from .sel_client.api.default import (
+    post_api_testresult_device_id,
+    post_api_testresult_device_id_snapshot,
+)
+from .sel_client.models import SnapshotRequest, TestResultRequest
+from .breaker import CircuitBreaker
+from .flush import flush_queue
+from .snapshot import SnapshotIndex
+from .upload_queue import UploadQueue
+from .walk import find_source_files
+from .payload import (
+    ARCHIVES,
+    fit_budget,
+    resolve_format,
+    write_tar,
+)
 from _pytest.reports import TestReport
-import tarfile
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional
 from datetime import datetime
-from pickle import load, dump
 from httpx import Timeout
+import asyncio
+import json
+import os
 import threading
+import uuid
+
+# ソースコードの tar はこの大きさまではメモリ上に置き，超えたら一時ファイルに書き出す
+SPOOL_MAX_SIZE = 1024 * 1024
 
 
 class Uploader:
     def __init__(self, device_id: str):
-        self.client = Client(base_url=LPP_BASE_URL, timeout=Timeout(3))
+        self.client = Client(
+            base_url=LPP_BASE_URL, timeout=Timeout(LPP_UPLOAD_TIMEOUT)
+        )
         self.device_id = device_id
         self.test_results: list[TestCaseResult] = []
-        self.test_queue_dir = Path(LPP_DATA_DIR) / "upload_queue"
+        self.queue = UploadQueue()
+        self.breaker = CircuitBreaker()
         self.stop_retry = threading.Event()
         self.retry_thread = None
         self.retry_success = True  # Track if background retry succeeded
+        self.upload_format = resolve_format(LPP_UPLOAD_FORMAT)
 
     def add_test_result(self, report: TestReport):
         self.test_results.append(
@@ -42,19 +71,92 @@ class Uploader:
     def has_any_test_result(self):
         return len(self.test_results) > 0
 
-    def _compress_tar(self, files) -> BytesIO:
-        tar = BytesIO()
-        with tarfile.open(fileobj=tar, mode="w") as tf:
-            for file in files:
-                tf.add(file)
+    def _compress_tar(self, files) -> BinaryIO:
+        # ファイル毎に書き込むため，大きなファイルがあってもメモリ使用量は SPOOL_MAX_SIZE 程度に収まる
+        tar = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode="w+b")
+        write_tar(tar, files, self.upload_format)
         return tar
 
-    def _store_test_result(self, test_result: TestResultRequest):
-        filename = f"{datetime.now().timestamp()}.dat"
-        self.test_queue_dir.mkdir(parents=True, exist_ok=True)
-        test_result_file = self.test_queue_dir / filename
-        with open(test_result_file, "wb") as f:
-            dump(test_result, f)
+    def _build_test_result(self, source_dir: str, test_type: str) -> TestResultRequest:
+        source_blob = self._compress_tar(find_source_files(source_dir))
+        source_blob.seek(0)
+
+        suffix, mime_type = ARCHIVES[self.upload_format]
+        return TestResultRequest(
+            device_time=datetime.now(),
+            test_type=test_type,
+            result=fit_budget(self.test_results, LPP_UPLOAD_BUDGET),
+            testcases=File(payload=BytesIO(), file_name="source.tar"),
+            source_code=File(
+                payload=source_blob, file_name=f"source{suffix}", mime_type=mime_type
+            ),
+        )
+
+    def _upload_snapshot(
+        self, source_dir: str, test_type: str, idempotency_key: str
+    ) -> bool:
+        """サーバが持っていないファイルの内容だけを送る．差分送信に対応していない場合は False"""
+        index = SnapshotIndex(LPP_BASE_URL, self.device_id)
+        if not index.supported():
+            return False
+
+        manifest = index.build_manifest(
+            source_dir, find_source_files(source_dir)
+        )
+        by_hash = {digest: relpath for relpath, digest in manifest.items()}
+        # 初めて送る場合は manifest だけを送り，サーバが持っていないものを 409 で教えてもらう
+        # (差分送信に対応していないサーバに全体を送ってしまわないようにするため)
+        missing = index.missing(manifest) if index.blobs else []
+        suffix, mime_type = ARCHIVES[self.upload_format]
+        # 記録が古く，サーバが持っていない内容があった場合は1度だけ送り直す
+        for _ in range(2):
+            blobs = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode="w+b")
+            with blobs:
+                # 送るものが無い場合は空にする (空の tar でも 10KiB になるため)
+                if missing:
+                    write_tar(
+                        blobs,
+                        [os.path.join(source_dir, by_hash[h]) for h in missing],
+                        self.upload_format,
+                        arcnames=missing,
+                    )
+                    blobs.seek(0)
+                body = SnapshotRequest(
+                    device_time=datetime.now(),
+                    test_type=test_type,
+                    manifest=File(
+                        payload=BytesIO(json.dumps(manifest).encode()),
+                        file_name="manifest.json",
+                        mime_type="application/json",
+                    ),
+                    blobs=File(
+                        payload=blobs, file_name=f"blobs{suffix}", mime_type=mime_type
+                    ),
+                    result=fit_budget(self.test_results, LPP_UPLOAD_BUDGET),
+                )
+                response = post_api_testresult_device_id_snapshot.sync_detailed(
+                    device_id=self.device_id,
+                    client=self.client,
+                    body=body,
+                    idempotency_key=idempotency_key,
+                )
+
+            if response.status_code == 201:
+                index.commit(manifest)
+                return True
+            if response.status_code in (404, 405, 501):
+                index.mark_unsupported()
+                return False
+            if response.status_code != 409 or response.parsed is None:
+                break
+            index.forget(response.parsed.missing)
+            missing = index.missing(manifest)
+        raise Exception(f"Failed to upload snapshot: {response.content}")
+
+    def _store_test_result(
+        self, test_result: TestResultRequest, idempotency_key: Optional[str] = None
+    ):
+        self.queue.put(test_result, idempotency_key)
 
     def start_background_retry(self):
         """Start background thread to retry failed uploads"""
@@ -69,93 +171,61 @@ class Uploader:
         self.retry_success = self._flush_test_queue()
 
     def _flush_test_queue(self) -> bool:
-        files = list(self.test_queue_dir.glob("*.dat")) if self.test_queue_dir.exists() else []
-        for file in files:
-            # Check if we should stop
-            if self.stop_retry.is_set():
-                return True
-            
-            with open(file, "rb") as f:
-                test_result = load(f)
-            try:
-                response = post_api_testresult_device_id.sync_detailed(
-                    device_id=self.device_id, client=self.client, body=test_result
-                )
-
-                if response.status_code != 201:
-                    raise Exception(
-                        f"Failed to upload test results: {response.content}"
-                    )
-
-                file.unlink()
-
-            except Exception as e:
-                # 1件でもアップロードに失敗した場合は、次回アップロード時に再度アップロードを試みる
-                return False
-        return True
+        self.queue.import_legacy()
+        success = asyncio.run(flush_queue(self.queue, self.device_id, self.stop_retry))
+        if success:
+            self.queue.compact()
+        return success
 
     def store(self, source_dir: str, test_type: str):
-        source_files = sum(
-            [
-                glob(f"{source_dir}/**/{pat}", recursive=True)
-                for pat in LPP_SOURCE_FILES
-            ],
-            [],
-        )
-
-        source_blob = self._compress_tar(source_files)
-        source_blob.seek(0)
-
-        result = TestResultRequest(
-            device_time=datetime.now(),
-            test_type=test_type,
-            result=self.test_results,
-            testcases=File(payload=BytesIO(), file_name="source.tar"),
-            source_code=File(payload=source_blob, file_name="source.tar"),
-        )
-
-        self._store_test_result(result)
+        result = self._build_test_result(source_dir, test_type)
+        try:
+            self._store_test_result(result)
+        finally:
+            result.source_code.payload.close()
 
     def upload(self, source_dir: str, test_dir: str, test_type: str):
         # Stop background retry thread if running
         self.stop_retry.set()
         if self.retry_thread and self.retry_thread.is_alive():
-            self.retry_thread.join(timeout=0.5)  # Wait briefly for thread to stop
+            # 送信中のものは削除されないまま終了すると重複して再送されるため，完了を待つ
+            self.retry_thread.join(timeout=LPP_UPLOAD_TIMEOUT)
         
         # If background retry failed, skip upload and store for later
         can_upload = self.retry_success
 
-        # Find source code files
-        source_files = sum(
-            [
-                glob(f"{source_dir}/**/{pat}", recursive=True)
-                for pat in LPP_SOURCE_FILES
-            ],
-            [],
-        )
-
-        source_blob = self._compress_tar(source_files)
-        source_blob.seek(0)
-
-        result = TestResultRequest(
-            device_time=datetime.now(),
-            test_type=test_type,
-            result=self.test_results,
-            testcases=File(payload=BytesIO(), file_name="source.tar"),
-            source_code=File(payload=source_blob, file_name="source.tar"),
-        )
+        result = None
+        # 送信できずに保存したものを後で送り直す際も同じ値を送り，サーバが重複を除けるようにする
+        idempotency_key = str(uuid.uuid4())
 
         # Upload test result
         try:
             if not can_upload:
                 raise Exception("Background retry failed, skipping upload")
-            
-            response = post_api_testresult_device_id.sync_detailed(
-                device_id=self.device_id, client=self.client, body=result
-            )
+
+            # 接続できない状態が続いている場合は CircuitOpen となり，保存だけする
+            with self.breaker.attempt():
+                if LPP_UPLOAD_DEDUP and self._upload_snapshot(
+                    source_dir, test_type, idempotency_key
+                ):
+                    return
+
+                result = self._build_test_result(source_dir, test_type)
+                response = post_api_testresult_device_id.sync_detailed(
+                    device_id=self.device_id,
+                    client=self.client,
+                    body=result,
+                    idempotency_key=idempotency_key,
+                )
 
             if response.status_code != 201:
                 raise Exception(f"Failed to upload test results: {response.content}")
         except:
-            self._store_test_result(result)
+            # 保存したものは差分送信に対応していないサーバにも送れるよう，tar 全体を保存する
+            if result is None:
+                result = self._build_test_result(source_dir, test_type)
+            self._store_test_result(result, idempotency_key)
             return
+        finally:
+            if result is not None:
+                result.source_code.payload.close()
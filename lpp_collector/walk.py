@@ -0,0 +1,195 @@
+"""ソースコードの探索
+
+LPP_SOURCE_FILES のいずれかに一致するファイルを，ディレクトリを1回走査して集める．
+
+- 名前が . で始まるもの (.git など) と PRUNE_DIRS のディレクトリは辿らない
+- ソースコードのディレクトリの .lppignore に書かれたパターンに一致するものは除く
+  (1行に1つ．/ で終わるものはディレクトリのみ，/ を含むものは相対パス全体と照合する)
+- LPP_SOURCE_MAX_SIZE を超えるファイルは除く
+- シンボリックリンクのディレクトリは LPP_SOURCE_FOLLOW_SYMLINKS=1 の場合のみ辿る
+
+ディレクトリ毎の一覧は更新日時と共にデータディレクトリに保存し，次回は更新日時が
+変わっていないディレクトリを読み直さない．
+
+ビルドのキャッシュのキー (build.py) では，送信しないファイルの変更もビルドに影響するため，
+upload_filters=False として .lppignore，PRUNE_DIRS，LPP_SOURCE_MAX_SIZE を適用せず，
+シンボリックリンクのディレクトリも辿る．
+"""
+
+import json
+import os
+import tempfile
+import time
+from fnmatch import fnmatch
+from typing import Any, Dict, List, Set, Tuple
+
+from lpp_collector.config import (
+    LPP_SOURCE_FILES,
+    LPP_SOURCE_FOLLOW_SYMLINKS,
+    LPP_SOURCE_MAX_SIZE,
+    LPP_SOURCE_WALK_CACHE,
+)
+
+# 生成物や依存パッケージなど，ソースコードを含まないディレクトリ
+PRUNE_DIRS = {"test_results", "node_modules", "__pycache__", "venv"}
+IGNORE_FILE = ".lppignore"
+# 更新日時の分解能が粗いファイルシステムで，走査と同時に変更されたものを見逃さないよう，
+# 走査した時刻からこの秒数以内に更新されたディレクトリは記録を使わない
+MTIME_MARGIN = 2.0
+# 記録しておくソースコードのディレクトリの数
+CACHE_ENTRIES = 64
+
+
+def load_ignore(source_dir: str) -> List[str]:
+    try:
+        with open(os.path.join(source_dir, IGNORE_FILE), encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def is_ignored(relpath: str, is_dir: bool, ignore: List[str]) -> bool:
+    name = os.path.basename(relpath)
+    for pattern in ignore:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        target = relpath if "/" in pattern else name
+        if fnmatch(target, pattern.lstrip("/")):
+            return True
+    return False
+
+
+def load_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path: str, cache: Dict[str, Any]):
+    # 古いものから削除する
+    if len(cache) > CACHE_ENTRIES:
+        recent = sorted(cache, key=lambda key: cache[key]["scanned_at"])
+        for key in recent[: len(cache) - CACHE_ENTRIES]:
+            del cache[key]
+
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".source_walk-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # 記録できなくても探索の結果には影響しない
+        pass
+
+
+def scan_dir(
+    path: str,
+    reldir: str,
+    ignore: List[str],
+    prune_dirs: Set[str] = PRUNE_DIRS,
+    follow_symlinks: bool = LPP_SOURCE_FOLLOW_SYMLINKS,
+) -> Tuple[List[str], List[str]]:
+    """ディレクトリ内の (ソースコードの候補のファイル名, 辿るディレクトリ名)"""
+    files, dirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            relpath = f"{reldir}/{entry.name}" if reldir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name not in prune_dirs and not is_ignored(
+                    relpath, True, ignore
+                ):
+                    dirs.append(entry.name)
+            elif any(fnmatch(entry.name, pat) for pat in LPP_SOURCE_FILES):
+                if not is_ignored(relpath, False, ignore):
+                    files.append(entry.name)
+    return files, dirs
+
+
+def find_source_files(source_dir: str, upload_filters: bool = True) -> List[str]:
+    """source_dir 以下のソースコードのパス (source_dir を先頭に付けたもの，重複なし)．
+    upload_filters=False の場合は LPP_SOURCE_FILES のパターンだけで選ぶ
+    """
+    if upload_filters:
+        ignore = load_ignore(source_dir)
+        prune_dirs, follow_symlinks, max_size = (
+            PRUNE_DIRS,
+            LPP_SOURCE_FOLLOW_SYMLINKS,
+            LPP_SOURCE_MAX_SIZE,
+        )
+    else:
+        ignore, prune_dirs, follow_symlinks, max_size = [], set(), True, 0
+    settings = [LPP_SOURCE_FILES, ignore, follow_symlinks, sorted(prune_dirs)]
+
+    cache = load_cache(LPP_SOURCE_WALK_CACHE)
+    # 送信用とビルド用の一覧は別に記録する (交互に使っても読み直さないように)
+    key = os.path.abspath(source_dir) + ("" if upload_filters else "\0all")
+    previous = cache.get(key, {})
+    if previous.get("settings") != settings:
+        previous = {}
+    cached_dirs = previous.get("dirs", {})
+    trusted_before = previous.get("scanned_at", 0) - MTIME_MARGIN
+
+    scanned_at = time.time()
+    dirs_listing: Dict[str, list] = {}
+    # シンボリックリンクを辿る場合に，同じディレクトリを2回辿らないようにする
+    visited = set()
+    found = []
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        path = os.path.join(source_dir, reldir) if reldir else source_dir
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+
+        cached = cached_dirs.get(reldir)
+        if (
+            cached is not None
+            and cached[0] == stat.st_mtime_ns
+            and stat.st_mtime < trusted_before
+        ):
+            files, dirs = cached[1], cached[2]
+        else:
+            try:
+                files, dirs = scan_dir(
+                    path, reldir, ignore, prune_dirs, follow_symlinks
+                )
+            except OSError:
+                continue
+        dirs_listing[reldir] = [stat.st_mtime_ns, files, dirs]
+
+        for name in files:
+            file_path = os.path.join(path, name)
+            if max_size > 0:
+                try:
+                    if os.stat(file_path).st_size > max_size:
+                        continue
+                except OSError:
+                    continue
+            found.append(file_path)
+        stack += [f"{reldir}/{name}" if reldir else name for name in dirs]
+
+    cache[key] = {
+        "settings": settings,
+        "scanned_at": scanned_at,
+        "dirs": dirs_listing,
+    }
+    save_cache(LPP_SOURCE_WALK_CACHE, cache)
+    return sorted(found)
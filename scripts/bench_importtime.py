@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Measure the startup cost of lpptest and of the pytest plugin.
+
+Runs each scenario with ``python -X importtime`` several times and reports the
+best wall time and the cumulative import time of the heaviest top-level modules.
+
+    python scripts/bench_importtime.py [--repeat 5] [--top 8] [--budget-ms 150]
+
+With --budget-ms the script exits with status 1 when the lpp_collector import
+time of any scenario exceeds the budget.
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+SCENARIOS = {
+    "lpptest --help": [
+        "-c",
+        "import sys; sys.argv = ['lpptest', '--help']; "
+        "from lpp_collector.runner import main; main()",
+    ],
+    # 空のディレクトリで pytest を起動し，プラグインの読み込みのみを計測する
+    "pytest (plugin only)": ["-m", "pytest", "-q", "--co", "-p", "no:cacheprovider"],
+}
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int]]:
+    """トップレベルの import 毎の累積時間 (us)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # インデントの無いものがトップレベルの import
+        if not name.startswith("  "):
+            modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def run_scenario(args: List[str], cwd: str) -> Tuple[float, List[Tuple[str, int]]]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    elapsed = time.perf_counter() - started
+    return elapsed, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    over_budget = False
+    with tempfile.TemporaryDirectory() as cwd:
+        for title, scenario in SCENARIOS.items():
+            best_elapsed = float("inf")
+            best_modules: List[Tuple[str, int]] = []
+            for _ in range(args.repeat):
+                elapsed, modules = run_scenario(scenario, cwd)
+                if elapsed < best_elapsed:
+                    best_elapsed, best_modules = elapsed, modules
+
+            totals: Dict[str, int] = {}
+            for name, cumulative in best_modules:
+                totals[name] = totals.get(name, 0) + cumulative
+            lpp_ms = sum(
+                us for name, us in totals.items() if name.startswith("lpp_collector")
+            ) / 1000
+
+            print(f"== {title}")
+            print(f"   wall time (best of {args.repeat}): {best_elapsed * 1000:.1f} ms")
+            print(f"   lpp_collector imports: {lpp_ms:.1f} ms")
+            for name, us in sorted(totals.items(), key=lambda item: -item[1])[
+                : args.top
+            ]:
+                print(f"   {us / 1000:8.1f} ms  {name}")
+
+            if args.budget_ms is not None and lpp_ms > args.budget_ms:
+                print(f"   over budget ({args.budget_ms:.1f} ms)")
+                over_budget = True
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -71,13 +71,9 @@ if should_check_update; then
     check_update
 fi
 
-# Prepare bash history
-DOCKER_HISTFILE="$CONFIG_DIR/bash_history"
-touch "$DOCKER_HISTFILE"
-
-# Run the container
+# Run the container (as the current user, see docker/entrypoint.sh)
 docker run -it --rm -v "$PWD:/workspaces" \
     -v "$CONFIG_DIR:/lpp/data" \
-    -v "$DOCKER_HISTFILE:/root/.bash_history" \
+    --env "TARGET_UID=$(id -u)" --env "TARGET_GID=$(id -g)" \
     --env-file "$CONFIG_PATH" \
     -w /workspaces "$DOCKER_IMAGE" "$@"
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""A local stand-in for the image registry, for trying out update checks.
+
+Answers manifest requests the way ghcr.io does, including the anonymous bearer
+token handshake, without serving any layers:
+
+    HEAD/GET /v2/{repository}/manifests/{tag}
+    GET      /token?service=...&scope=...
+
+    python scripts/registry_stub_server.py [--port 5000] [--digest sha256:...]
+
+Point lpptest at it with DOCKER_IMAGE=localhost:5000/lpp_test:latest. The digest
+can be changed while running by writing a new one to the file given by
+--digest-file, to simulate a new image being pushed.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+TOKEN = "stub-token"
+MANIFEST_TYPE = "application/vnd.oci.image.index.v1+json"
+
+
+def make_handler(digest: str, digest_file: Optional[str]):
+    def current_digest() -> str:
+        if digest_file is None:
+            return digest
+        try:
+            with open(digest_file) as f:
+                return f.read().strip() or digest
+        except OSError:
+            return digest
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status: int, body: bytes = b"", headers: Optional[dict] = None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/token"):
+                body = json.dumps({"token": TOKEN}).encode()
+                return self.reply(200, body, {"Content-Type": "application/json"})
+
+            match = re.fullmatch(r"/v2/(.+)/manifests/([^/]+)", self.path)
+            if match is None:
+                return self.reply(404)
+            if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+                host = self.headers.get("Host", "localhost")
+                challenge = (
+                    f'Bearer realm="http://{host}/token",service="{host}",'
+                    f'scope="repository:{match.group(1)}:pull"'
+                )
+                return self.reply(401, headers={"WWW-Authenticate": challenge})
+            self.reply(
+                200,
+                b"{}",
+                {
+                    "Content-Type": MANIFEST_TYPE,
+                    "Docker-Content-Digest": current_digest(),
+                },
+            )
+
+        do_HEAD = do_GET
+
+        def log_message(self, format, *args):
+            print(f"{self.command} {self.path} -> {args[1]}", flush=True)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--digest",
+        default="sha256:" + hashlib.sha256(b"lpp_test").hexdigest(),
+        help="manifest digest to report",
+    )
+    parser.add_argument(
+        "--digest-file",
+        help="read the digest from this file on every request, if it exists",
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(args.digest, args.digest_file)
+    )
+    print(f"Listening on http://{args.host}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
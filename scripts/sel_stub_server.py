@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""A local stand-in for the research server, for trying out uploads.
+
+Implements the endpoints used by lpp_collector and keeps everything in memory:
+
+    POST   /api/device/{device_id}
+    DELETE /api/device/{device_id}
+    DELETE /api/student/{student_id}
+    POST   /api/testresult/{device_id}
+    POST   /api/testresult/{device_id}/snapshot
+    POST   /api/testresult/{device_id}/bulk
+
+    python scripts/sel_stub_server.py [--port 8080] [--no-snapshot] [--no-bulk]
+                                      [--fail-rate 0.2]
+
+Point lpptest at it with LPP_BASE_URL=http://127.0.0.1:8080/. Every request is
+logged with the number of bytes received, and a summary is printed on Ctrl-C.
+A result whose Idempotency-Key was already accepted is answered with 201 again
+but counted as a duplicate instead of being stored.
+"""
+
+import argparse
+import email.parser
+import email.policy
+import gzip
+import hashlib
+import io
+import json
+import random
+import re
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blobs: Dict[str, bytes] = {}
+        self.results = 0
+        self.snapshots = 0
+        self.duplicates = 0
+        self.received = 0
+        self.keys = set()
+
+    def accept(self, key: Optional[str]) -> bool:
+        """False if a result with this Idempotency-Key was already stored"""
+        with self.lock:
+            if key is not None and key in self.keys:
+                self.duplicates += 1
+                return False
+            if key is not None:
+                self.keys.add(key)
+            return True
+
+
+def decode(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def archive_encoding(file_name: str) -> Optional[str]:
+    if file_name.endswith(".gz"):
+        return "gzip"
+    if file_name.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def parse_parts(content_type: str, body: bytes) -> List[Tuple[str, str, bytes]]:
+    """(name, file_name, decoded content) for each part"""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    parts = []
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        file_name = part.get_filename() or ""
+        # like a real server, ignore per-part Content-Encoding (not in RFC 7578)
+        data = part.get_payload(decode=True)
+        parts.append((name, file_name, data))
+    return parts
+
+
+def parse_multipart(content_type: str, body: bytes) -> Dict[str, Tuple[str, bytes]]:
+    """name -> (file_name, decoded content)"""
+    return {
+        name: (file_name, data)
+        for name, file_name, data in parse_parts(content_type, body)
+    }
+
+
+def make_handler(store: Store, snapshot: bool, bulk: bool, fail_rate: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status: int, body: Optional[dict] = None):
+            content = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def read_body(self) -> bytes:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with store.lock:
+                store.received += len(body)
+            return body
+
+        def do_DELETE(self):
+            self.read_body()
+            if re.fullmatch(r"/api/(device|student)/[^/]+", self.path):
+                return self.reply(204)
+            self.reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self.read_body()
+            if fail_rate > 0 and random.random() < fail_rate:
+                return self.reply(503, {"error": "injected failure"})
+
+            if re.fullmatch(r"/api/device/[^/]+", self.path):
+                return self.reply(200)
+            if re.fullmatch(r"/api/testresult/[^/]+", self.path):
+                parse_multipart(self.headers["Content-Type"], body)
+                if store.accept(self.headers.get("Idempotency-Key")):
+                    with store.lock:
+                        store.results += 1
+                return self.reply(201)
+            if snapshot and re.fullmatch(r"/api/testresult/[^/]+/snapshot", self.path):
+                return self.snapshot(body)
+            if bulk and re.fullmatch(r"/api/testresult/[^/]+/bulk", self.path):
+                return self.bulk(body)
+            self.reply(404, {"error": "not found"})
+
+        def bulk(self, body: bytes):
+            results, sources = [], set()
+            for name, file_name, data in parse_parts(
+                self.headers["Content-Type"], body
+            ):
+                if name == "results":
+                    results = json.loads(data)
+                elif name == "sources":
+                    # named by the SHA-256 of the archive, followed by its suffix
+                    digest = file_name.split(".")[0]
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        return self.reply(400, {"error": f"bad source {file_name}"})
+                    sources.add(digest)
+
+            accepted = []
+            for result in results:
+                if result["source"] not in sources:
+                    continue
+                if store.accept(result["idempotencyKey"]):
+                    with store.lock:
+                        store.results += 1
+                accepted.append(result["idempotencyKey"])
+            self.reply(200, {"accepted": accepted})
+
+        def snapshot(self, body: bytes):
+            parts = parse_multipart(self.headers["Content-Type"], body)
+            manifest = json.loads(parts["manifest"][1])
+            file_name, archive = parts["blobs"]
+
+            # an empty part means there is nothing new to store
+            received = {}
+            if archive:
+                archive = decode(archive, archive_encoding(file_name))
+                with tarfile.open(fileobj=io.BytesIO(archive)) as tf:
+                    for member in tf.getmembers():
+                        data = tf.extractfile(member).read()
+                        if hashlib.sha256(data).hexdigest() != member.name:
+                            return self.reply(400, {"error": f"bad blob {member.name}"})
+                        received[member.name] = data
+
+            with store.lock:
+                store.blobs.update(received)
+                missing = sorted(set(manifest.values()) - set(store.blobs))
+            if missing:
+                return self.reply(409, {"missing": missing})
+            if store.accept(self.headers.get("Idempotency-Key")):
+                with store.lock:
+                    store.snapshots += 1
+            self.reply(201)
+
+        def log_message(self, format, *args):
+            print(
+                f"{self.command} {self.path} -> {args[1]} "
+                f"({self.headers.get('Content-Length', 0)} bytes)",
+                flush=True,
+            )
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="answer 404 on the snapshot endpoint, like a server without it",
+    )
+    parser.add_argument(
+        "--no-bulk",
+        action="store_true",
+        help="answer 404 on the bulk endpoint, like a server without it",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        help="fraction of POST requests answered with 503",
+    )
+    args = parser.parse_args()
+
+    store = Store()
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(store, not args.no_snapshot, not args.no_bulk, args.fail_rate),
+    )
+    print(f"Listening on http://{args.host}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(
+        f"{store.results} full result(s), {store.snapshots} snapshot(s), "
+        f"{store.duplicates} duplicate(s), {len(store.blobs)} blob(s), "
+        f"{store.received} bytes received"
+    )
+
+
+if __name__ == "__main__":
+    main()